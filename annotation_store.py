@@ -0,0 +1,133 @@
+# numpy is imported by the methods that need it, so the taggers can read the
+# state codes below before it loads
+
+# Per-point state; EMPTY marks a (frame, label) slot with no annotation. The
+# non-empty values are also written to the output's {label}_flag columns.
+EMPTY = 0
+MANUAL = 1
+PROPAGATED = 2
+# Only ever produced by interpolate.py, never stored while tagging
+INTERPOLATED = 3
+
+
+class AnnotationStore:
+    """Tagged points indexed by frame, then label.
+
+    Coordinates live in a dense (frames, labels, 2) int32 array with a parallel
+    state array, so upsert, delete and per-frame lookups are O(1) array accesses
+    and a whole frame is a single row. The frame axis grows geometrically when a
+    point is added past the current capacity.
+    """
+
+    def __init__(self, labels, num_frames=1024):
+        import numpy as np
+        self.labels = list(labels)
+        self._label_idx = {lbl: i for i, lbl in enumerate(self.labels)}
+        num_frames = max(1, num_frames)
+        self._xy = np.zeros((num_frames, len(self.labels), 2), dtype=np.int32)
+        self._state = np.zeros((num_frames, len(self.labels)), dtype=np.uint8)
+        self._frame_counts = np.zeros(num_frames, dtype=np.int32)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _grow(self, frame):
+        import numpy as np
+        capacity = self._state.shape[0]
+        new_capacity = max(frame + 1, capacity * 2)
+        pad = new_capacity - capacity
+        self._xy = np.concatenate([self._xy, np.zeros((pad,) + self._xy.shape[1:], np.int32)])
+        self._state = np.concatenate([self._state, np.zeros((pad, len(self.labels)), np.uint8)])
+        self._frame_counts = np.concatenate([self._frame_counts, np.zeros(pad, np.int32)])
+
+    def upsert(self, frame, label, x, y, state=MANUAL):
+        if frame >= self._state.shape[0]:
+            self._grow(frame)
+        li = self._label_idx[label]
+        if self._state[frame, li] == EMPTY:
+            self._frame_counts[frame] += 1
+            self._count += 1
+        self._xy[frame, li] = (x, y)
+        self._state[frame, li] = state
+
+    def delete(self, frame, label):
+        li = self._label_idx[label]
+        if frame >= self._state.shape[0] or self._state[frame, li] == EMPTY:
+            return False
+        self._state[frame, li] = EMPTY
+        self._frame_counts[frame] -= 1
+        self._count -= 1
+        return True
+
+    def clear_frame(self, frame):
+        import numpy as np
+        if frame >= self._state.shape[0]:
+            return []
+        removed = [self.labels[i] for i in np.flatnonzero(self._state[frame])]
+        self._state[frame] = EMPTY
+        self._count -= int(self._frame_counts[frame])
+        self._frame_counts[frame] = 0
+        return removed
+
+    def get(self, frame, label):
+        li = self._label_idx[label]
+        if frame >= self._state.shape[0] or self._state[frame, li] == EMPTY:
+            return None
+        x, y = self._xy[frame, li]
+        return int(x), int(y)
+
+    def state(self, frame, label):
+        if frame >= self._state.shape[0]:
+            return EMPTY
+        return int(self._state[frame, self._label_idx[label]])
+
+    def frame_points(self, frame):
+        # [(label, x, y), ...] in label order
+        import numpy as np
+        if frame >= self._state.shape[0] or not self._frame_counts[frame]:
+            return []
+        xy = self._xy[frame]
+        return [(self.labels[i], int(xy[i, 0]), int(xy[i, 1]))
+                for i in np.flatnonzero(self._state[frame])]
+
+    def frame_entries(self, frame):
+        # [(label, x, y, state), ...] in label order
+        import numpy as np
+        if frame >= self._state.shape[0] or not self._frame_counts[frame]:
+            return []
+        xy, state = self._xy[frame], self._state[frame]
+        return [(self.labels[i], int(xy[i, 0]), int(xy[i, 1]), int(state[i]))
+                for i in np.flatnonzero(state)]
+
+    def frame_count(self, frame, state=None):
+        import numpy as np
+        if frame >= self._state.shape[0]:
+            return 0
+        if state is None:
+            return int(self._frame_counts[frame])
+        return int(np.count_nonzero(self._state[frame] == state))
+
+    def is_complete(self, frame, state=None):
+        # All labels present, or all labels in the given state
+        return self.frame_count(frame, state) == len(self.labels)
+
+    def complete_frames(self, state=None):
+        # Frames with every label present (or every label in the given state), ascending
+        import numpy as np
+        if state is None:
+            return np.flatnonzero(self._frame_counts == len(self.labels))
+        return np.flatnonzero((self._state == state).all(axis=1))
+
+    def has_state(self, state):
+        import numpy as np
+        return bool(np.any(self._state == state))
+
+    def frames(self):
+        import numpy as np
+        return np.flatnonzero(self._frame_counts)
+
+    def to_arrays(self):
+        # (frames, xy, state) for every frame with at least one point, frame ascending
+        frames = self.frames()
+        return frames, self._xy[frames], self._state[frames]
@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from coord_io import HAVE_PYARROW, load_table, save_table
+from bench_homography import synthetic_tagged
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def run(rows, keypoints, directory=None):
+    df = synthetic_tagged(rows, keypoints)
+    formats = ["csv", "npz"] + (["parquet"] if HAVE_PYARROW else [])
+    results = []
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        for fmt in formats:
+            path = os.path.join(tmp, "tagged." + fmt)
+            save_s, _ = timed(lambda: save_table(df, path))
+            load_s, loaded = timed(lambda: load_table(path, mmap=False))
+            entry = {"format": fmt, "save_s": save_s, "load_s": load_s,
+                     "size_mb": os.path.getsize(path) / 1e6}
+            if fmt == "npz":
+                # Mapping is lazy, so touch every column to make the comparison fair
+                entry["load_mmap_s"], _ = timed(lambda: load_table(path).sum(numeric_only=True))
+            assert list(loaded.columns) == list(df.columns)
+            results.append(entry)
+    return {"rows": rows, "keypoints": keypoints, "formats": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare CSV, NPZ and Parquet for tagged coordinates")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--keypoints", type=int, default=30)
+    args = parser.parse_args()
+    result = run(args.rows, args.keypoints)
+    print(f"{result['rows']} rows x {result['keypoints']} keypoints")
+    for entry in result["formats"]:
+        line = (f"  {entry['format']:8s} save {entry['save_s']:7.3f}s  load {entry['load_s']:7.3f}s  "
+                f"{entry['size_mb']:8.1f} MB")
+        if "load_mmap_s" in entry:
+            line += f"  (memory-mapped load {entry['load_mmap_s']:.3f}s)"
+        print(line)
+    if not HAVE_PYARROW:
+        print("  parquet  skipped (pyarrow not installed)")
@@ -0,0 +1,73 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from apply_homography import Homography, coordinate_stems
+
+# Pixel corners of a doubles court and their metric positions
+COURT_PX = [(221, 843), (621, 246), (1292, 246), (1695, 843)]
+COURT_M = [(0, 0), (0, 23.77), (10.97, 23.77), (10.97, 0)]
+
+
+def synthetic_tagged(rows, keypoints, missing=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    data = {"frame": np.arange(rows)}
+    for k in range(keypoints):
+        for axis, hi in (("x", 1920), ("y", 1080)):
+            col = rng.uniform(0, hi, rows)
+            col[rng.random(rows) < missing] = np.nan
+            data[f"kp{k}_{axis}"] = col
+    return pd.DataFrame(data)
+
+
+def per_stem_loop(df, H):
+    # The pre-Homography implementation: one perspectiveTransform and two column inserts per stem
+    df = df.copy()
+    for stem in coordinate_stems(df.columns):
+        coords = df[[stem + "_x", stem + "_y"]].values.astype(np.float32)
+        projected = cv2.perspectiveTransform(np.expand_dims(coords, axis=1), H).reshape(-1, 2)
+        df[stem + "_x_meters"] = projected[:, 0]
+        df[stem + "_y_meters"] = projected[:, 1]
+    return df
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run(rows, keypoints, repeat=3):
+    df = synthetic_tagged(rows, keypoints)
+    homography = Homography.from_points(COURT_PX, COURT_M)
+    loop_s = best_of(lambda: per_stem_loop(df, homography.matrix), repeat)
+    batched_s = best_of(lambda: homography.transform(df), repeat)
+    return {
+        "rows": rows,
+        "keypoints": keypoints,
+        "per_stem_loop_s": loop_s,
+        "homography_s": batched_s,
+        "speedup": loop_s / batched_s,
+        "points_per_s": rows * keypoints / batched_s,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Homography against the per-stem loop")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--keypoints", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    result = run(args.rows, args.keypoints, args.repeat)
+    print(f"{result['rows']} rows x {result['keypoints']} keypoints")
+    print(f"  per-stem loop: {result['per_stem_loop_s']:.3f}s")
+    print(f"  Homography:    {result['homography_s']:.3f}s "
+          f"({result['speedup']:.1f}x, {result['points_per_s'] / 1e6:.1f}M points/s)")
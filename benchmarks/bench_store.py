@@ -0,0 +1,80 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from annotation_store import AnnotationStore
+from synthetic import label_names
+
+# Largest allowed growth of an operation's cost from the smallest to the largest
+# store size. Timings here vary by about 10%; an operation that scans the store
+# grows with the size ratio (100x from 10k to 1M).
+MAX_SLOWDOWN = 3.0
+
+
+def per_op_us(fn, args, repeat=1, reset=None):
+    # Best mean cost per call in microseconds over `repeat` passes; reset() runs untimed between passes
+    best = float("inf")
+    for _ in range(repeat):
+        if reset is not None:
+            reset()
+        start = time.perf_counter()
+        for arg in args:
+            fn(*arg)
+        best = min(best, (time.perf_counter() - start) / len(args))
+    return 1e6 * best
+
+
+def measure(annotations, labels=10, ops=20_000, repeat=5, seed=0):
+    # Per-operation cost in microseconds on a store holding `annotations` points
+    names = label_names(labels)
+    frames = max(1, annotations // labels)
+    store = AnnotationStore(names)
+    fill = [(fr, lbl, fr % 1920, fr % 1080) for fr in range(frames) for lbl in names]
+    insert_us = per_op_us(store.upsert, fill)
+    rng = random.Random(seed)
+    # Distinct slots, so every delete removes a point at any store size
+    slots = rng.sample(range(frames * labels), min(ops, frames * labels))
+    targets = [(slot // labels, names[slot % labels]) for slot in slots]
+    restore = lambda: [store.upsert(fr, lbl, 1, 2) for fr, lbl in targets]
+    return {
+        "annotations": len(store),
+        "insert_us": insert_us,
+        "update_us": per_op_us(lambda fr, lbl: store.upsert(fr, lbl, 1, 2), targets, repeat),
+        "frame_query_us": per_op_us(lambda fr, lbl: store.frame_points(fr), targets, repeat),
+        "delete_us": per_op_us(store.delete, targets, repeat, reset=restore),
+    }
+
+
+def run(sizes, labels=10, max_slowdown=MAX_SLOWDOWN):
+    """Per-operation costs at each store size, plus the largest size's cost
+    relative to the smallest (about 1.0 when operations do not slow down as the
+    store grows). "failed" lists the operations whose ratio exceeds max_slowdown."""
+    results = [measure(size, labels) for size in sorted(sizes)]
+    small, large = results[0], results[-1]
+    ratios = {key: large[key] / small[key] for key in small if key.endswith("_us")}
+    failed = [key for key, ratio in ratios.items() if ratio > max_slowdown]
+    return {"sizes": results, "large_vs_small": ratios, "failed": failed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that AnnotationStore operations stay flat as the store grows")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000],
+                        help="Store sizes in annotations")
+    parser.add_argument("--labels", type=int, default=10)
+    parser.add_argument("--max_slowdown", type=float, default=MAX_SLOWDOWN,
+                        help="Fail if any operation costs more than this many times as much at the "
+                             "largest size as at the smallest")
+    args = parser.parse_args()
+    result = run(args.sizes, args.labels, args.max_slowdown)
+    ops = list(result["large_vs_small"])
+    print(f"{'annotations':>12}" + "".join(f"{op:>16}" for op in ops))
+    for entry in result["sizes"]:
+        print(f"{entry['annotations']:>12}" + "".join(f"{entry[op]:>16.2f}" for op in ops))
+    print(f"{'large/small':>12}" + "".join(f"{result['large_vs_small'][op]:>15.2f}x" for op in ops))
+    if result["failed"]:
+        print(f"FAILED: {', '.join(result['failed'])} grew more than {args.max_slowdown:g}x")
+        sys.exit(1)
+    print(f"OK: every operation within {args.max_slowdown:g}x")
@@ -0,0 +1,331 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import cv2
+from PIL import Image
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+from frame_source import FrameSource, KeyframeIndex
+from rendering import DisplayCache, OverlayLayer, to_display
+from annotation_store import AnnotationStore
+from journal import Journal
+from apply_homography import apply_homography
+from video_tagger import load_labels
+import bench_formats
+import bench_homography
+import bench_store
+import synthetic
+
+DISPLAY_SIZE = (800, 450)
+
+FULL = {
+    "videos": [(640, 360, "mp4v", 12), (1920, 1080, "mp4v", 12), (1920, 1080, "MJPG", 1),
+               (3840, 2160, "mp4v", 12)],
+    "frames": 240,
+    "seeks": 50,
+    "labels": 10,
+    "store_frames": 100_000,
+    "store_scaling": [10_000, 1_000_000],
+    "homography_rows": 1_000_000,
+    "apply_rows": 100_000,
+    "format_rows": 200_000,
+    "keypoints": 30,
+}
+QUICK = {
+    "videos": [(640, 360, "mp4v", 12), (1280, 720, "MJPG", 1)],
+    "frames": 60,
+    "seeks": 10,
+    "labels": 10,
+    "store_frames": 10_000,
+    "store_scaling": [10_000, 100_000],
+    "homography_rows": 100_000,
+    "apply_rows": 10_000,
+    "format_rows": 20_000,
+    "keypoints": 30,
+}
+
+
+class NullCanvas:
+    """Stands in for tk.Canvas when no display is available; counts item operations."""
+
+    def __init__(self):
+        self.ops = 0
+        self._next_id = 0
+
+    def _create(self, *args, **kwargs):
+        self.ops += 1
+        self._next_id += 1
+        return self._next_id
+
+    create_oval = create_text = create_image = _create
+
+    def coords(self, *args):
+        self.ops += 1
+
+    def itemconfig(self, *args, **kwargs):
+        self.ops += 1
+
+    def delete(self, *args):
+        self.ops += 1
+
+
+def stats_ms(times):
+    times = sorted(times)
+    return {
+        "mean_ms": 1000 * sum(times) / len(times),
+        "p50_ms": 1000 * times[len(times) // 2],
+        "p95_ms": 1000 * times[min(len(times) - 1, int(0.95 * len(times)))],
+    }
+
+
+def timed_each(fn, items):
+    times = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def legacy_render(frame, points, size):
+    # The original display_frame: draw on a full-resolution copy, convert, PIL-resize
+    display = frame.copy()
+    for lbl, x, y in points:
+        cv2.circle(display, (x, y), 4, (0, 255, 0), -1)
+        cv2.putText(display, f"{lbl} - ({x}, {y})", (x + 5, y - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+    rgb = cv2.cvtColor(display, cv2.COLOR_BGR2RGB)
+    return Image.fromarray(rgb).resize(size)
+
+
+def bench_video(path, cfg):
+    index_start = time.perf_counter()
+    index = KeyframeIndex.build(path)
+    index_s = time.perf_counter() - index_start
+    keyframes = index.keyframes if index else [0]
+
+    source = FrameSource(path, prefetch=False, keyframe_index=False)
+    source.keyframes = index
+    n = min(cfg["frames"], source.total_frames)
+    try:
+        sequential = timed_each(source.get_frame, range(n))
+        # Second pass over the same window is served from the frame cache
+        cached = timed_each(source.get_frame, [i for i in range(n // 2, n // 2 + 10) for _ in (0, 1)])
+        rng = random.Random(0)
+        source.cache.clear()
+        seeks = timed_each(source.get_frame, [rng.randrange(n) for _ in range(cfg["seeks"])])
+        frame = source.get_frame(0)
+        conversions = timed_each(lambda _: to_display(frame, DISPLAY_SIZE), range(10))
+    finally:
+        source.close()
+    return {
+        "width": source.width,
+        "height": source.height,
+        "frames": n,
+        "keyframes": len(keyframes),
+        "mean_gop": n / max(1, len([k for k in keyframes if k < n])),
+        "index_build_s": index_s,
+        "sequential_fps": n / sum(sequential),
+        "sequential": stats_ms(sequential),
+        "cached_step": stats_ms(cached),
+        "random_seek": stats_ms(seeks),
+        "display_convert": stats_ms(conversions),
+    }
+
+
+def bench_overlay(frame, labels, canvas):
+    h, w = frame.shape[:2]
+    rng = random.Random(0)
+    points = [(lbl, rng.randrange(w), rng.randrange(h)) for lbl in labels]
+    legacy = timed_each(lambda _: legacy_render(frame, points, DISPLAY_SIZE), range(10))
+
+    cache = DisplayCache(DISPLAY_SIZE)
+    cache.get(0, frame)
+    overlay = OverlayLayer(canvas, lambda x, y: (x * DISPLAY_SIZE[0] / w, y * DISPLAY_SIZE[1] / h))
+    overlay.sync({lbl: (x, y, lbl) for lbl, x, y in points})
+
+    def click(i):
+        lbl, x, y = points[i % len(points)]
+        cache.get(0, frame)
+        overlay.set(lbl, x + i % 7, y, f"{lbl} - ({x + i % 7}, {y})")
+
+    clicks = timed_each(click, range(1000))
+    return {"legacy_render_per_click": stats_ms(legacy), "overlay_per_click": stats_ms(clicks)}
+
+
+def bench_annotations(cfg, labels):
+    store = AnnotationStore(labels, 1024)
+    frames = cfg["store_frames"]
+    start = time.perf_counter()
+    for fr in range(frames):
+        for lbl in labels:
+            store.upsert(fr, lbl, fr % 1920, fr % 1080)
+    upsert_s = time.perf_counter() - start
+    rng = random.Random(0)
+    queries = timed_each(store.frame_points, [rng.randrange(frames) for _ in range(10_000)])
+    deletes = timed_each(lambda fr: store.delete(fr, labels[0]), [rng.randrange(frames) for _ in range(10_000)])
+    start = time.perf_counter()
+    store.to_arrays()
+    export_s = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        journal = Journal(os.path.join(tmp, "bench.journal"))
+        start = time.perf_counter()
+        for fr in range(100_000):
+            journal.append("set", fr, labels[0], 1, 2)
+        append_s = time.perf_counter() - start
+        journal.close()
+
+    return {
+        "annotations": frames * len(labels),
+        "upsert_us": 1e6 * upsert_s / (frames * len(labels)),
+        "frame_query": stats_ms(queries),
+        "delete": stats_ms(deletes),
+        "export_s": export_s,
+        "journal_append_us": 1e6 * append_s / 100_000,
+    }
+
+
+def bench_apply(cfg, tmp):
+    # End to end: a generated tagged CSV and calibration CSV through apply_homography
+    tagged = synthetic.make_tagged_csv(os.path.join(tmp, "tagged.csv"), cfg["apply_rows"], cfg["keypoints"])
+    court = synthetic.make_calibration_csv(os.path.join(tmp, "calibration.csv"))
+    start = time.perf_counter()
+    _, rows = apply_homography(tagged, court)
+    elapsed = time.perf_counter() - start
+    return {"rows": rows, "seconds": elapsed, "rows_per_s": rows / elapsed}
+
+
+def make_canvas():
+    # A real Tk canvas when a display (or Xvfb) is available, otherwise the headless stand-in
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+        return tk.Canvas(root, width=DISPLAY_SIZE[0], height=DISPLAY_SIZE[1]), "tk"
+    except Exception:
+        return NullCanvas(), "headless"
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(cfg, only=None, workdir=None):
+    results = {}
+    selected = lambda name: only is None or name in only
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        # Read back the way the tagger reads its labels file
+        labels = load_labels(synthetic.make_labels(os.path.join(tmp, "labels.csv"), cfg["labels"]))
+        if selected("video") or selected("overlay"):
+            results["video"] = {}
+            for width, height, codec, gop in cfg["videos"]:
+                name = f"{width}x{height}_{codec}_gop{gop}"
+                path = os.path.join(tmp, name + synthetic.CODEC_EXTENSIONS[codec])
+                try:
+                    synthetic.make_video(path, width, height, cfg["frames"], codec=codec, gop=gop)
+                except RuntimeError as e:
+                    results["video"][name] = {"error": str(e)}
+                    continue
+                print(f"video {name}")
+                if selected("video"):
+                    results["video"][name] = bench_video(path, cfg)
+                last_video = path
+            if selected("overlay"):
+                canvas, backend = make_canvas()
+                source = FrameSource(last_video, prefetch=False, keyframe_index=False)
+                frame = source.get_frame(0)
+                source.close()
+                print("overlay")
+                results["overlay"] = dict(bench_overlay(frame, labels, canvas), canvas=backend,
+                                          source=f"{frame.shape[1]}x{frame.shape[0]}")
+            if not selected("video"):
+                del results["video"]
+        if selected("store"):
+            print("annotation store")
+            results["store"] = dict(bench_annotations(cfg, labels), scaling=bench_store.run(cfg["store_scaling"]))
+        if selected("homography"):
+            print("homography")
+            results["homography"] = bench_homography.run(cfg["homography_rows"], cfg["keypoints"], repeat=1)
+            results["homography"]["apply_homography_csv"] = bench_apply(cfg, tmp)
+        if selected("formats"):
+            print("formats")
+            results["formats"] = bench_formats.run(cfg["format_rows"], cfg["keypoints"], tmp)
+    return results
+
+
+def flatten(d, prefix=""):
+    out = {}
+    for key, value in d.items():
+        name = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            out.update(flatten(value, name))
+        elif isinstance(value, list):
+            for i, item in enumerate(value):
+                label = item.get("format", i) if isinstance(item, dict) else i
+                out.update(flatten(item if isinstance(item, dict) else {"value": item}, f"{name}.{label}"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = flatten(json.load(f)["results"])
+    with open(new_path) as f:
+        new = flatten(json.load(f)["results"])
+    for key in sorted(set(old) & set(new)):
+        if old[key]:
+            print(f"{key:60s} {old[key]:12.4g} -> {new[key]:12.4g}  ({100 * (new[key] / old[key] - 1):+.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless benchmark suite for the annotation tools")
+    parser.add_argument("--quick", action="store_true", help="Small sizes for a fast smoke run")
+    parser.add_argument("--only", type=str,
+                        help="Comma separated subset of: video, overlay, store, homography, formats")
+    parser.add_argument("--output", type=str, help="Result JSON path (default: benchmarks/results/{commit}.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD_JSON", "NEW_JSON"),
+                        help="Print the relative change of every metric between two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    commit = git_commit()
+    cfg = QUICK if args.quick else FULL
+    results = run(cfg, set(args.only.split(",")) if args.only else None)
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "quick": args.quick,
+        "platform": {"python": platform.python_version(), "machine": platform.machine(),
+                     "system": platform.system(), "cpus": os.cpu_count(),
+                     "numpy": np.__version__, "opencv": cv2.__version__},
+        "results": results,
+    }
+    output = args.output or os.path.join(BENCH_DIR, "results", f"{commit or 'local'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to {output}")
+    # The store scaling check is the one pass/fail result in the suite
+    failed = results.get("store", {}).get("scaling", {}).get("failed")
+    if failed:
+        print(f"FAILED: annotation store operations {', '.join(failed)} slow down as the store grows")
+        sys.exit(1)
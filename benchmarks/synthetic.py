@@ -0,0 +1,73 @@
+import csv
+import os
+import sys
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_homography import COURT_M, COURT_PX, synthetic_tagged
+
+CODEC_EXTENSIONS = {"mp4v": ".mp4", "avc1": ".mp4", "MJPG": ".avi", "XVID": ".avi"}
+
+
+def make_video(path, width, height, num_frames, fps=30, codec="mp4v", gop=None, seed=0):
+    """Write a synthetic clip with a textured, panning background and moving blobs.
+
+    gop is passed to the encoder as a key-frame interval, which only some OpenCV
+    backends honour (MJPG is always intra-only); measure the result with
+    KeyframeIndex rather than trusting the request.
+    """
+    params = [cv2.VIDEOWRITER_PROP_KEY_INTERVAL, gop] if gop else []
+    writer = cv2.VideoWriter(path, cv2.CAP_FFMPEG, cv2.VideoWriter_fourcc(*codec), fps,
+                             (width, height), params)
+    if not writer.isOpened():
+        raise RuntimeError(f"No encoder available for codec {codec}")
+    rng = np.random.default_rng(seed)
+    # Low-frequency texture so the encoder has real motion to compensate
+    texture = cv2.resize(rng.integers(0, 255, (height // 8 + 1, width // 8 + 1, 3), dtype=np.uint8),
+                         (width + 64, height + 64), interpolation=cv2.INTER_LINEAR)
+    radius = max(4, height // 20)
+    try:
+        for i in range(num_frames):
+            shift = i % 64
+            frame = np.ascontiguousarray(texture[shift:shift + height, shift:shift + width])
+            for k in range(5):
+                cx = int((0.5 + 0.4 * np.sin(0.05 * i + k)) * width)
+                cy = int((0.5 + 0.4 * np.cos(0.07 * i + 2 * k)) * height)
+                cv2.circle(frame, (cx, cy), radius, (40 * k, 255 - 40 * k, 128), -1)
+            cv2.putText(frame, str(i), (10, height - 10), cv2.FONT_HERSHEY_SIMPLEX,
+                        height / 360, (255, 255, 255), 2)
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
+
+
+def label_names(num_labels):
+    return [f"kp{k}" for k in range(num_labels)]
+
+
+def make_labels(path, num_labels):
+    # A labels CSV as video_tagger.py reads it: one "label" column
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["label"])
+        writer.writerows([lbl] for lbl in label_names(num_labels))
+    return path
+
+
+def make_tagged_csv(path, rows, keypoints, missing=0.05, seed=0):
+    df = synthetic_tagged(rows, keypoints, missing, seed)
+    df.to_csv(path, index=False)
+    return path
+
+
+def make_calibration_csv(path, jitter=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Point", "X", "Y", "GrX", "GrY"])
+        for i, ((x, y), (gx, gy)) in enumerate(zip(COURT_PX, COURT_M)):
+            dx, dy = rng.normal(0, jitter, 2) if jitter else (0, 0)
+            writer.writerow([f"Point{i + 1}", int(x + dx), int(y + dy), gx, gy])
+    return path
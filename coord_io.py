@@ -0,0 +1,98 @@
+import importlib.util
+import os
+import struct
+import zipfile
+
+# pandas and pyarrow are only imported when a table is loaded, so the taggers
+# start without paying for them
+HAVE_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+FORMATS = ("csv", "npz", "parquet")
+_COLUMNS_KEY = "__columns__"
+
+
+def table_format(path):
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    return ext if ext in FORMATS else "csv"
+
+
+def coordinate_stems(columns):
+    # Find all coordinate column stems (e.g., "left_knee" from "left_knee_x", "left_knee_y")
+    columns = set(columns)
+    return sorted(col[:-2] for col in columns
+                  if col.endswith("_x") and col[:-2] + "_y" in columns)
+
+
+def save_table(df, path):
+    """Write a table as CSV, NPZ or Parquet depending on the file extension.
+
+    NPZ files hold one uncompressed array per column plus the column names, so
+    load_table can memory-map them instead of reading them.
+    """
+    import numpy as np
+    fmt = table_format(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+    elif fmt == "npz":
+        arrays = {_COLUMNS_KEY: np.array(df.columns, dtype=str)}
+        for i, col in enumerate(df.columns):
+            values = df[col].to_numpy()
+            if values.dtype == object:
+                values = df[col].fillna("").to_numpy(dtype=str)
+            arrays[f"c{i}"] = values
+        # np.savez appends .npz to names without it, so write through a handle
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+    else:
+        _require_pyarrow()
+        df.to_parquet(path, index=False)
+
+
+def load_table(path, mmap=True):
+    import pandas as pd
+    fmt = table_format(path)
+    if fmt == "csv":
+        return pd.read_csv(path)
+    if fmt == "npz":
+        arrays = _load_npz(path, mmap)
+        columns = [str(c) for c in arrays[_COLUMNS_KEY]]
+        return pd.DataFrame({col: arrays[f"c{i}"] for i, col in enumerate(columns)}, copy=False)
+    _require_pyarrow()
+    return pd.read_parquet(path)
+
+
+def _require_pyarrow():
+    if not HAVE_PYARROW:
+        raise RuntimeError("Parquet files require pyarrow (pip install pyarrow)")
+
+
+def _load_npz(path, mmap):
+    import numpy as np
+    if not mmap:
+        with np.load(path) as npz:
+            return {name: npz[name] for name in npz.files}
+    # Members written by np.savez are stored uncompressed, so each .npy payload
+    # sits contiguously in the zip file and can be mapped in place
+    arrays = {}
+    with open(path, "rb") as raw, zipfile.ZipFile(raw) as zf:
+        for info in zf.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            with zf.open(info) as member:
+                version = np.lib.format.read_magic(member)
+                if version == (1, 0):
+                    shape, fortran, dtype = np.lib.format.read_array_header_1_0(member)
+                else:
+                    shape, fortran, dtype = np.lib.format.read_array_header_2_0(member)
+                header_len = member.tell()
+            if info.compress_type != zipfile.ZIP_STORED or dtype.hasobject or not shape or 0 in shape:
+                with zf.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+            # Local file header: 30 fixed bytes, then the name and extra fields
+            raw.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack("<HH", raw.read(4))
+            offset = info.header_offset + 30 + name_len + extra_len + header_len
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", shape=shape, offset=offset,
+                                     order="F" if fortran else "C")
+    return arrays
@@ -1,50 +1,126 @@
+import time
+# Time-to-interactive is measured from here, so it includes the imports below
+_STARTED = time.perf_counter()
 import tkinter as tk
 from tkinter import ttk
-import cv2
 from PIL import Image, ImageTk
 import csv
 import os
 import argparse
 import sys
+import threading
+from frame_source import DEFAULT_CACHE_MB
+from proxy import PROXY_KINDS, open_frame_source
+from rendering import DisplayCache, OverlayLayer, Viewport, bind_viewport, disable_controls, enable_controls
+from journal import Journal, journal_path, replay
+from coord_io import FORMATS, save_table, table_format
+from perf import Profiler, PerfHud
 
 # Define paths here
 VIDEO_PATH = "example/tennis_test.mp4"
 NUM_POINTS = 4
 
 class CourtSelector:
-    def __init__(self, video_path, num_points, output_csv):
+    def __init__(self, video_path, num_points, output_csv, cache_mb=DEFAULT_CACHE_MB,
+                 profile=False, trace_path=None, proxy=None):
         self.video_path = video_path
+        self.profiler = Profiler(enabled=profile, trace=bool(trace_path))
+        self.trace_path = trace_path
         self.num_points = num_points
         self.output_csv = output_csv
-        self.cap = cv2.VideoCapture(self.video_path)
-        if not self.cap.isOpened():
-            raise RuntimeError(f"Cannot open video '{self.video_path}'")
-        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.source = None
+        self.total_frames = 0
         self.current_frame_idx = 0
 
         self.points = [
-            {"index": i+1, "x": "", "y": "", "grx": "", "gry": ""}
+            {"index": i+1, "x": "", "y": "", "grx": "", "gry": "", "frame": ""}
             for i in range(self.num_points)
         ]
 
         self.root = tk.Tk()
         self.root.title("Select Court Points")
-        self.root.protocol("WM_DELETE_WINDOW", self.on_save)
-        self.root.bind("<Left>", lambda e: self.prev_frame())
-        self.root.bind("<Right>", lambda e: self.next_frame())
 
         self.setup_gui()
         self.root.update_idletasks()
         self.display_width = self.canvas.winfo_width()
         self.display_height = self.canvas.winfo_height()
-        self.load_frame()
+        self.viewport = Viewport((self.display_width, self.display_height))
+        self.display_cache = DisplayCache((self.display_width, self.display_height), profiler=self.profiler,
+                                          viewport=self.viewport)
+        self.overlay = OverlayLayer(self.canvas, self.to_canvas, radius=5)
+        self._canvas_img_id = None
+        # F2 toggles the timing overlay
+        self.hud = PerfHud(self.root, self.canvas, self.profiler)
+        self.root.bind("<F2>", lambda e: self.hud.toggle())
+        if profile:
+            self.hud.show()
+        # As in video_tagger.py, the video is opened on a loader thread behind a disabled window
+        self._disabled = disable_controls(self.root)
+        self._loading_text = self.canvas.create_text(
+            self.display_width / 2, self.display_height / 2,
+            text=f"Opening {os.path.basename(self.video_path)}...")
+        self._opened = None
+        self._shown_at = None
+        self.root.protocol("WM_DELETE_WINDOW", self.cancel_open)
+        self._loader = threading.Thread(target=self.open_video, args=(cache_mb, proxy), daemon=True)
+        self._loader.start()
+        self.root.after(10, self.poll_open)
         self.root.mainloop()
 
+    def open_video(self, cache_mb, proxy):
+        # Loader thread: everything that touches the video file, which is also
+        # where cv2 and numpy first get imported
+        start = time.perf_counter()
+        try:
+            source = open_frame_source(self.video_path, cache_mb, proxy)
+            source.get_frame(0)
+        except Exception as e:
+            self._opened = e
+            return
+        self._opened = (source, time.perf_counter() - start)
+
+    def cancel_open(self):
+        # Closed before the video was ready: with the window gone, wait for the
+        # loader so the video is closed before the interpreter exits
+        self.root.destroy()
+        self._loader.join()
+        if isinstance(self._opened, tuple):
+            self._opened[0].close()
+
+    def poll_open(self):
+        if self._shown_at is None:
+            self._shown_at = time.perf_counter()
+        if self._loader.is_alive():
+            self.root.after(10, self.poll_open)
+            return
+        if isinstance(self._opened, Exception):
+            print(f"Error: {self._opened}")
+            self.canvas.itemconfig(self._loading_text, text=f"Cannot open the video:\n{self._opened}")
+            return
+        source, open_s = self._opened
+        self.source = source
+        self.total_frames = self.source.total_frames
+        # Opened only now, so closing before the video is ready leaves no journal behind
+        self.resume_journal()
+        self.journal = Journal(journal_path(self.output_csv))
+        self.canvas.delete(self._loading_text)
+        enable_controls(self._disabled)
+        self.viewport.set_source(self.source.width, self.source.height)
+        self.load_frame()
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.table.bind("<Button-1>", self.on_table_click)
+        self.table.bind("<Double-1>", self.on_double_click)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_save)
+        self.root.bind("<Left>", lambda e: self.prev_frame())
+        self.root.bind("<Right>", lambda e: self.next_frame())
+        bind_viewport(self.canvas, self.viewport, self.on_viewport_change)
+        print(f"Window shown after {1000 * (self._shown_at - _STARTED):.0f} ms, interactive after "
+              f"{1000 * (time.perf_counter() - _STARTED):.0f} ms (opening the video and decoding "
+              f"the first frame took {1000 * open_s:.0f} ms)")
 
     def setup_gui(self):
         self.canvas = tk.Canvas(self.root, width=800, height=450)
         self.canvas.pack()
-        self.canvas.bind("<Button-1>", self.on_click)
 
         ctrl = tk.Frame(self.root)
         ctrl.pack(pady=5)
@@ -79,61 +155,86 @@ class CourtSelector:
             self.table.heading(c, text=c)
             self.table.column(c, width=80, anchor=tk.CENTER)
         self.table.pack(fill="both", expand=True)
-        self.table.bind("<Button-1>", self.on_table_click)
-        self.table.bind("<Double-1>", self.on_double_click)
 
         btn_frame = tk.Frame(self.root)
         btn_frame.pack(pady=5)
         tk.Button(btn_frame, text="Save & Exit", command=self.on_save).pack()
 
     def load_frame(self):
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame_idx)
-        ret, frame = self.cap.read()
-        if not ret:
-            return
-        self.frame_bgr = frame.copy()
-        self.frame_label.config(text=f"Frame: {self.current_frame_idx}")
-        self.display_frame()
-        self.update_table()
+        with self.profiler.stage("frame"):
+            with self.profiler.stage("decode"):
+                frame = self.source.get_frame(self.current_frame_idx)
+            if frame is None:
+                return
+            # Cached frames are shared and must not be drawn on
+            self.frame_bgr = frame
+            self.frame_label.config(text=f"Frame: {self.current_frame_idx}")
+            self.show_image(self.display_cache.get(self.current_frame_idx, frame))
+            self.display_frame()
+            self.update_table()
 
-    def display_frame(self):
-        self.canvas.delete("all")  # Clear previous frame (optional but avoids stacking)
-        disp = self.frame_bgr.copy()
-        for pt in self.points:
-            if pt["x"] and pt["y"]:
-                x, y = int(pt["x"]), int(pt["y"])
-                cv2.circle(disp, (x,y), 5, (0,255,0), -1)
-                cv2.putText(disp, f"P{pt['index']}", (x+5,y-5),
-                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0,0,255), 2)
-        rgb = cv2.cvtColor(disp, cv2.COLOR_BGR2RGB)
+    def show_image(self, rgb):
+        with self.profiler.stage("photoimage"):
+            self.tk_img = ImageTk.PhotoImage(Image.fromarray(rgb))
+        if self._canvas_img_id is None:
+            self._canvas_img_id = self.canvas.create_image(0, 0, anchor="nw", image=self.tk_img)
+            self.canvas.tag_lower(self._canvas_img_id)
+        else:
+            self.canvas.itemconfig(self._canvas_img_id, image=self.tk_img)
+
+    def to_canvas(self, x, y):
+        # Points are kept in original-resolution pixels, also when frames come from a smaller proxy
+        return self.viewport.to_canvas(x, y)
 
-        self.original_width = disp.shape[1]
-        self.original_height = disp.shape[0]
+    def on_viewport_change(self):
+        # Zoom or pan: re-crop the current frame and move the markers
+        self.show_image(self.display_cache.get(self.current_frame_idx, self.frame_bgr))
+        self.overlay.relayout()
 
-        img = Image.fromarray(rgb).resize((self.display_width, self.display_height))
-        self.tk_img = ImageTk.PhotoImage(img)
-        self.canvas.create_image(0, 0, anchor="nw", image=self.tk_img)
+    def display_frame(self):
+        # Court points are frame independent, so this only syncs the marker layer
+        with self.profiler.stage("overlay"):
+            self.overlay.sync({
+                pt["index"]: (int(pt["x"]), int(pt["y"]), f"P{pt['index']}")
+                for pt in self.points if pt["x"] and pt["y"]
+            })
 
     def update_table(self):
-        for r in self.table.get_children():
-            self.table.delete(r)
-        for pt in self.points:
-            vals = (f"Point{pt['index']}", pt["x"], pt["y"], pt["grx"], pt["gry"], "Delete")
-            self.table.insert("", "end", iid=str(pt["index"]), values=vals)
+        with self.profiler.stage("table"):
+            for r in self.table.get_children():
+                self.table.delete(r)
+            for pt in self.points:
+                vals = (f"Point{pt['index']}", pt["x"], pt["y"], pt["grx"], pt["gry"], "Delete")
+                self.table.insert("", "end", iid=str(pt["index"]), values=vals)
+
+    def resume_journal(self):
+        # A journal left next to the output means the last session did not exit cleanly
+        applied = 0
+        for record in replay(journal_path(self.output_csv)):
+            if record[0] == "point" and 1 <= record[1] <= self.num_points:
+                self.points[record[1] - 1].update(zip(("x", "y", "grx", "gry", "frame"), record[2:]))
+            elif record[0] == "reset":
+                for pt in self.points:
+                    pt.update({"x": "", "y": "", "grx": "", "gry": "", "frame": ""})
+            applied += 1
+        if applied:
+            print(f"Resumed {applied} changes from {journal_path(self.output_csv)}")
+
+    def log_point(self, pt):
+        self.journal.append("point", pt["index"], pt["x"], pt["y"], pt["grx"], pt["gry"], pt["frame"])
 
     def on_click(self, event):
-        # Scale back to original resolution
-        x_scale = self.original_width / self.display_width
-        y_scale = self.original_height / self.display_height
-
-        fx = int(event.x * x_scale)
-        fy = int(event.y * y_scale)
+        # The original-resolution pixel under the cursor at the current zoom
+        fx, fy = self.viewport.to_source(event.x, event.y)
 
         for pt in self.points:
             if not pt["x"] and not pt["y"]:
                 pt["x"], pt["y"] = str(fx), str(fy)
+                # The reference frame for per-frame homographies (track_homography.py)
+                pt["frame"] = str(self.current_frame_idx)
+                self.log_point(pt)
+                self.overlay.set(pt["index"], fx, fy, f"P{pt['index']}")
                 break
-        self.display_frame()
         self.update_table()
 
 
@@ -145,8 +246,9 @@ class CourtSelector:
         if not row or col != "#6":
             return
         idx = int(row) - 1
-        self.points[idx].update({"x": "", "y": "", "grx": "", "gry": ""})
-        self.display_frame()
+        self.points[idx].update({"x": "", "y": "", "grx": "", "gry": "", "frame": ""})
+        self.log_point(self.points[idx])
+        self.overlay.remove(self.points[idx]["index"])
         self.update_table()
 
     def on_double_click(self, event):
@@ -168,6 +270,7 @@ class CourtSelector:
             pt = self.points[int(row)-1]
             if ci == 3: pt["grx"] = new
             else: pt["gry"] = new
+            self.log_point(pt)
             entry.destroy()
             self.update_table()
         entry.bind("<Return>", save)
@@ -185,23 +288,36 @@ class CourtSelector:
 
     def reset_points(self):
         for pt in self.points:
-            pt.update({"x": "", "y": "", "grx": "", "gry": ""})
-        self.display_frame()
+            pt.update({"x": "", "y": "", "grx": "", "gry": "", "frame": ""})
+        self.journal.append("reset")
+        self.overlay.clear()
         self.update_table()
 
     def on_save(self):
         os.makedirs(os.path.dirname(self.output_csv) or ".", exist_ok=True)
-        with open(self.output_csv, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["Point", "X", "Y", "GrX", "GrY"])
-            for pt in self.points:
-                writer.writerow([
-                    f"Point{pt['index']}", pt["x"], pt["y"], pt["grx"], pt["gry"]
-                ])
+        if table_format(self.output_csv) != "csv":
+            import pandas as pd
+            df = pd.DataFrame({"Point": [f"Point{pt['index']}" for pt in self.points]})
+            for col, key in (("X", "x"), ("Y", "y"), ("GrX", "grx"), ("GrY", "gry"), ("Frame", "frame")):
+                df[col] = pd.to_numeric([pt[key] for pt in self.points], errors="coerce")
+            save_table(df, self.output_csv)
+        else:
+            with open(self.output_csv, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["Point", "X", "Y", "GrX", "GrY", "Frame"])
+                for pt in self.points:
+                    writer.writerow([
+                        f"Point{pt['index']}", pt["x"], pt["y"], pt["grx"], pt["gry"], pt["frame"]
+                    ])
+        self.journal.close(remove=True)
+        if self.trace_path:
+            self.profiler.dump_trace(self.trace_path)
+        self.source.close()
         self.root.destroy()
         sys.exit(0)
 
-def main(video_path=None, num_points=None, output_csv=None):
+def main(video_path=None, num_points=None, output_csv=None, cache_mb=DEFAULT_CACHE_MB, output_format="csv",
+         profile=False, trace_path=None, proxy=None):
     if not video_path or not num_points:
         print("Error: You must provide at least a video path and number of points.")
         return
@@ -209,18 +325,31 @@ def main(video_path=None, num_points=None, output_csv=None):
     if output_csv is None:
         base = os.path.splitext(os.path.basename(video_path))[0]
         folder = os.path.dirname(video_path)
-        output_csv = os.path.join(folder, base + "_calibration.csv")
+        output_csv = os.path.join(folder, base + "_calibration." + output_format)
 
-    CourtSelector(video_path, num_points, output_csv)
+    CourtSelector(video_path, num_points, output_csv, cache_mb=cache_mb,
+                  profile=profile, trace_path=trace_path, proxy=proxy)
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         parser = argparse.ArgumentParser(description="Court point selector with calibration")
         parser.add_argument("num_points", type=int, help="Number of points to tag")
         parser.add_argument("video_path", type=str, help="Path to video file")
-        parser.add_argument("--output_csv", type=str, help="Optional output CSV path")
+        parser.add_argument("--output_csv", type=str,
+                            help="Optional output path (.csv, .npz or .parquet)")
+        parser.add_argument("--output_format", choices=FORMATS, default="csv",
+                            help="Format of the default output file when --output_csv is not given")
+        parser.add_argument("--cache_mb", type=int, default=DEFAULT_CACHE_MB,
+                            help="Memory budget in MB for decoded frames")
+        parser.add_argument("--profile", action="store_true",
+                            help="Show the per-stage timing overlay (toggle with F2)")
+        parser.add_argument("--trace", type=str,
+                            help="Record every timed stage and save a Chrome trace JSON here on exit")
+        parser.add_argument("--proxy", choices=PROXY_KINDS,
+                            help="Serve frames from a raw memory-mapped proxy (built on first use, see proxy.py)")
         args = parser.parse_args()
-        main(args.video_path, args.num_points, args.output_csv)
+        main(args.video_path, args.num_points, args.output_csv, args.cache_mb, args.output_format,
+             args.profile, args.trace, args.proxy)
     else:
         OUTPUT_CSV = None
         main(VIDEO_PATH, NUM_POINTS)
@@ -0,0 +1,175 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import cv2
+from annotation_store import MANUAL, PROPAGATED, INTERPOLATED
+from coord_io import coordinate_stems, load_table, table_format
+from frame_source import KeyframeIndex, chunk_ranges, read_frames
+
+# Frames per encoded segment
+SEGMENT_FRAMES = 500
+# BGR marker colour per point flag; files without flag columns are drawn as tagged by hand
+FLAG_COLOURS = {MANUAL: (0, 255, 0), PROPAGATED: (0, 165, 255), INTERPOLATED: (255, 255, 0)}
+
+
+def load_overlay(tagged_path, total_frames, meters=False):
+    """Dense per-frame arrays for drawing: (labels, xy, flags, metric).
+
+    xy is (total_frames, labels, 2) float with NaN where a label is not tagged,
+    flags the matching point flags and metric the {label}_{x|y}_meters values
+    (or None).
+    """
+    df = pd.read_csv(tagged_path) if table_format(tagged_path) == "csv" else load_table(tagged_path)
+    # Labels in file order rather than sorted
+    labels = sorted(coordinate_stems(df.columns), key=lambda stem: df.columns.get_loc(stem + "_x"))
+    frames = pd.to_numeric(df["frame"]).to_numpy(dtype=np.int64)
+    keep = (frames >= 0) & (frames < total_frames)
+    frames = frames[keep]
+
+    def dense(suffixes):
+        # (total_frames, labels, 2) from the {label}{suffix} columns, NaN on untagged frames
+        out = np.full((total_frames, len(labels), 2), np.nan)
+        for axis, suffix in enumerate(suffixes):
+            out[frames, :, axis] = df[[lbl + suffix for lbl in labels]].to_numpy(dtype=np.float64)[keep]
+        return out
+
+    xy = dense(("_x", "_y"))
+    flag_cols = [f"{lbl}_flag" for lbl in labels]
+    if all(col in df.columns for col in flag_cols):
+        flags = np.zeros((total_frames, len(labels)), dtype=np.int64)
+        flags[frames] = df[flag_cols].fillna(0).to_numpy(dtype=np.int64)[keep]
+    else:
+        flags = np.where(np.isnan(xy[..., 0]), 0, MANUAL)
+    metric = None
+    if meters:
+        if not all(f"{lbl}_{axis}_meters" in df.columns for lbl in labels for axis in ("x", "y")):
+            raise ValueError("--meters needs the _meters columns written by apply_homography.py")
+        metric = dense(("_x_meters", "_y_meters"))
+    return labels, xy, flags, metric
+
+
+def draw_points(frame, labels, xy, flags, metric=None):
+    # Same markers as the taggers: a dot and "label - (x, y)", or the metric position
+    scale = frame.shape[0] / 1080
+    radius = max(2, int(round(6 * scale)))
+    font_scale = max(0.4, 0.8 * scale)
+    thickness = max(1, int(round(2 * scale)))
+    for k, lbl in enumerate(labels):
+        x, y = xy[k]
+        if np.isnan(x) or np.isnan(y):
+            continue
+        x, y = int(round(x)), int(round(y))
+        colour = FLAG_COLOURS.get(int(flags[k]), FLAG_COLOURS[MANUAL])
+        cv2.circle(frame, (x, y), radius, colour, -1)
+        if metric is not None and not np.isnan(metric[k]).any():
+            text = f"{lbl} - ({metric[k, 0]:.2f}, {metric[k, 1]:.2f}) m"
+        else:
+            text = f"{lbl} - ({x}, {y})"
+        cv2.putText(frame, text, (x + radius + 2, y - radius - 2), cv2.FONT_HERSHEY_SIMPLEX,
+                    font_scale, (0, 0, 255), thickness, cv2.LINE_AA)
+
+
+def render_segment(video_path, start, stop, keyframe, labels, xy, flags, metric, segment_path, fourcc, fps, size):
+    # Worker: draws frames start..stop-1 (xy/flags/metric hold just this range) into one segment file
+    writer = cv2.VideoWriter(segment_path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+    if not writer.isOpened():
+        raise RuntimeError(f"Cannot open a {fourcc} writer for {segment_path}")
+    written = 0
+    try:
+        for idx, frame in read_frames(video_path, start, stop, keyframe):
+            i = idx - start
+            draw_points(frame, labels, xy[i], flags[i], None if metric is None else metric[i])
+            writer.write(frame)
+            written += 1
+    finally:
+        writer.release()
+    return written
+
+
+def concatenate(ffmpeg, segments, output_path):
+    # Stream copy, so the segments are not encoded a second time
+    listing = output_path + ".segments.txt"
+    with open(listing, "w") as f:
+        f.writelines(f"file '{os.path.abspath(path)}'\n" for path in segments)
+    try:
+        subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                        "-i", listing, "-c", "copy", output_path], check=True)
+    finally:
+        os.remove(listing)
+
+
+def export_overlay(video_path, tagged_path, output_path=None, meters=False, workers=None,
+                   segment_frames=SEGMENT_FRAMES, fourcc="mp4v"):
+    if output_path is None:
+        output_path = os.path.splitext(video_path)[0] + "_overlay.mp4"
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video '{video_path}'")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    cap.release()
+
+    labels, xy, flags, metric = load_overlay(tagged_path, total_frames, meters)
+    start_time = time.perf_counter()
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        # Segments could only be joined by decoding and re-encoding them all again,
+        # which costs more than the parallel render saves
+        frames = render_segment(video_path, 0, total_frames, 0, labels, xy, flags, metric,
+                                output_path, fourcc, fps, size)
+        render_s = time.perf_counter() - start_time
+        method = "one writer (ffmpeg not found, no parallel segments)"
+    else:
+        keyframes = KeyframeIndex.load_or_build(video_path)
+        segment_dir = tempfile.mkdtemp(prefix=".overlay_", dir=os.path.dirname(os.path.abspath(output_path)))
+        ext = os.path.splitext(output_path)[1] or ".mp4"
+        try:
+            ranges = chunk_ranges(total_frames, segment_frames)
+            segments = [os.path.join(segment_dir, f"{i:05d}{ext}") for i in range(len(ranges))]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(render_segment, video_path, start, stop,
+                                       keyframes.preceding(start) if keyframes else start,
+                                       labels, xy[start:stop], flags[start:stop],
+                                       None if metric is None else metric[start:stop],
+                                       path, fourcc, fps, size)
+                           for (start, stop), path in zip(ranges, segments)]
+                frames = sum(future.result() for future in futures)
+            render_s = time.perf_counter() - start_time
+            concatenate(ffmpeg, segments, output_path)
+            method = f"{len(segments)} parallel segments joined by ffmpeg stream copy"
+        finally:
+            shutil.rmtree(segment_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - start_time
+    video_s = frames / fps
+    print(f"Rendered {frames} frames with {method} in {render_s:.1f}s; total {elapsed:.1f}s = {frames / elapsed:.0f} fps, "
+          f"{video_s / elapsed:.2f}x real time")
+    print(f"Saved overlay video to {output_path}")
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render a review video with the tagged points drawn on every frame")
+    parser.add_argument("video_path", type=str, help="Path to video file")
+    parser.add_argument("tagged_csv", type=str,
+                        help="Tagged file from video_tagger.py, or apply_homography.py output for --meters")
+    parser.add_argument("--output", type=str, help="Output video (default: {video}_overlay.mp4)")
+    parser.add_argument("--meters", action="store_true", help="Label points with their metric coordinates")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--segment_frames", type=int, default=SEGMENT_FRAMES, help="Frames per encoded segment")
+    parser.add_argument("--codec", type=str, default="mp4v", help="FourCC of the output codec")
+    args = parser.parse_args()
+    try:
+        export_overlay(args.video_path, args.tagged_csv, args.output, args.meters, args.workers,
+                       args.segment_frames, args.codec)
+    except (RuntimeError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,310 @@
+import bisect
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Memory budget for decoded frames kept around the cursor
+DEFAULT_CACHE_MB = 512
+# Number of frames decoded ahead of / behind the cursor in the direction of travel
+PREFETCH_AHEAD = 12
+PREFETCH_BEHIND = 4
+# Reading forward is cheaper than a seek when the target is only a few frames ahead
+READ_FORWARD_LIMIT = 16
+
+
+def chunk_ranges(total_frames, chunk_frames):
+    return [(start, min(start + chunk_frames, total_frames))
+            for start in range(0, total_frames, chunk_frames)]
+
+
+def read_frames(video_path, start, stop, keyframe):
+    # Seek to `keyframe` (at or before `start`) and decode forward, yielding
+    # (idx, frame) for start <= idx < stop; used by the chunked batch stages
+    import cv2
+    cap = cv2.VideoCapture(video_path)
+    try:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+        for idx in range(keyframe, stop):
+            if idx < start:
+                ok, frame = cap.grab(), None
+            else:
+                ok, frame = cap.read()
+            if not ok:
+                return
+            if frame is not None:
+                yield idx, frame
+    finally:
+        cap.release()
+
+
+class FrameCache:
+    """LRU of decoded frames bounded by total bytes rather than frame count."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, idx):
+        with self._lock:
+            return idx in self._frames
+
+    def __len__(self):
+        with self._lock:
+            return len(self._frames)
+
+    def get(self, idx):
+        with self._lock:
+            frame = self._frames.get(idx)
+            if frame is not None:
+                self._frames.move_to_end(idx)
+            return frame
+
+    def put(self, idx, frame):
+        with self._lock:
+            old = self._frames.pop(idx, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            if frame.nbytes > self.max_bytes:
+                return
+            self._frames[idx] = frame
+            self.nbytes += frame.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self.nbytes = 0
+
+
+class KeyframeIndex:
+    """Frame numbers of the keyframes in a video, persisted as a JSON sidecar.
+
+    The sidecar is keyed by the video's size and mtime and rebuilt when either changes.
+    """
+
+    def __init__(self, keyframes, build_seconds=0.0):
+        self.keyframes = keyframes
+        self.build_seconds = build_seconds
+
+    def preceding(self, idx):
+        i = bisect.bisect_right(self.keyframes, idx) - 1
+        return self.keyframes[i] if i >= 0 else 0
+
+    @staticmethod
+    def sidecar_path(video_path):
+        return video_path + ".keyframes.json"
+
+    @classmethod
+    def load_or_build(cls, video_path):
+        st = os.stat(video_path)
+        sidecar = cls.sidecar_path(video_path)
+        try:
+            with open(sidecar) as f:
+                data = json.load(f)
+            if data["size"] == st.st_size and data["mtime_ns"] == st.st_mtime_ns:
+                return cls(data["keyframes"])
+        except (OSError, ValueError, KeyError):
+            pass
+
+        index = cls.build(video_path)
+        if index is None:
+            return None
+        print(f"Built keyframe index for {video_path}: "
+              f"{len(index.keyframes)} keyframes in {index.build_seconds:.2f}s")
+        try:
+            with open(sidecar, "w") as f:
+                json.dump({"size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                           "keyframes": index.keyframes}, f)
+        except OSError:
+            pass  # read-only media, keep the index in memory only
+        return index
+
+    @classmethod
+    def build(cls, video_path):
+        # Walk the compressed packets without decoding them. Packets are in decode
+        # order, so with open GOPs a keyframe may be recorded a few frames early,
+        # which only makes seeks land earlier, never past the target.
+        import cv2
+        start = time.perf_counter()
+        cap = cv2.VideoCapture(video_path)
+        try:
+            if not cap.isOpened() or not cap.set(cv2.CAP_PROP_FORMAT, -1):
+                return None
+            keyframes = []
+            idx = 0
+            while cap.grab():
+                if cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                    keyframes.append(idx)
+                idx += 1
+        finally:
+            cap.release()
+        if not keyframes or keyframes[0] != 0:
+            keyframes.insert(0, 0)
+        return cls(keyframes, time.perf_counter() - start)
+
+
+class FrameSource:
+    """Random-access frame reader shared by the taggers.
+
+    Decoded frames are kept in a FrameCache and a background thread prefetches
+    frames around the cursor, so stepping back and forth does not hit the decoder.
+    Random access seeks to the nearest preceding keyframe and decodes forward,
+    while sequential reads never seek. Returned frames are shared with the cache
+    and must not be modified in place.
+    """
+
+    def __init__(self, video_path, cache_mb=DEFAULT_CACHE_MB, prefetch=True, keyframe_index=True):
+        import cv2
+        self.video_path = video_path
+        self.cap = cv2.VideoCapture(video_path)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Cannot open video '{video_path}'")
+        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.cache = FrameCache(int(cache_mb * 1024 * 1024))
+        self.keyframes = KeyframeIndex.load_or_build(video_path) if keyframe_index else None
+        # Latency (seconds) of recent decodes that needed a seek
+        self.seek_times = deque(maxlen=1000)
+
+        # Index of the frame the next cap.read() will return
+        self._next_pos = 0
+        self._decode_lock = threading.Lock()
+
+        self._cursor = 0
+        self._direction = 1
+        self._pending = False
+        self._closed = False
+        self._wake = threading.Condition()
+        self._prefetcher = None
+        if prefetch:
+            self._prefetcher = threading.Thread(target=self._prefetch_loop, daemon=True)
+            self._prefetcher.start()
+
+    def get_frame(self, idx, move_cursor=True):
+        # Background readers pass move_cursor=False so they don't steer the prefetcher
+        if idx < 0 or idx >= self.total_frames:
+            return None
+        frame = self.cache.get(idx)
+        if frame is None:
+            frame = self._decode(idx)
+        if move_cursor:
+            self._move_cursor(idx)
+        return frame
+
+    def is_cached(self, idx):
+        return idx in self.cache
+
+    def seek_stats(self):
+        times = sorted(self.seek_times)
+        if not times:
+            return None
+        return {
+            "seeks": len(times),
+            "mean_ms": 1000 * sum(times) / len(times),
+            "p95_ms": 1000 * times[min(len(times) - 1, int(0.95 * len(times)))],
+        }
+
+    def close(self):
+        stats = self.seek_stats()
+        if stats:
+            print(f"Seeks: {stats['seeks']}, mean {stats['mean_ms']:.1f} ms, "
+                  f"p95 {stats['p95_ms']:.1f} ms")
+        with self._wake:
+            self._closed = True
+            self._wake.notify()
+        if self._prefetcher is not None:
+            self._prefetcher.join()
+        with self._decode_lock:
+            self.cap.release()
+
+    def _decode(self, idx):
+        with self._decode_lock:
+            if self._closed:
+                return None
+            # A cached copy may have been produced while we waited for the lock
+            frame = self.cache.get(idx)
+            if frame is not None:
+                return frame
+            start = time.perf_counter()
+            seeked = self._position_for(idx)
+            while True:
+                pos = self._next_pos
+                if pos < idx - PREFETCH_BEHIND:
+                    # Far from the target: decode without the colour conversion
+                    ret, frame = self.cap.grab(), None
+                else:
+                    ret, frame = self.cap.read()
+                if not ret:
+                    self._next_pos = -1
+                    return None
+                self._next_pos = pos + 1
+                if frame is not None:
+                    self.cache.put(pos, frame)
+                if pos == idx:
+                    if seeked:
+                        self.seek_times.append(time.perf_counter() - start)
+                    return frame
+
+    def _position_for(self, idx):
+        # Leave the decoder where it is if reading forward reaches idx, otherwise
+        # seek to the keyframe at or before idx. Returns True if a seek happened.
+        import cv2
+        gap = idx - self._next_pos
+        keyframe = self.keyframes.preceding(idx) if self.keyframes else idx
+        # After a failed read (_next_pos == -1) the decoder position is unknown
+        if self._next_pos >= 0 and gap >= 0 and (self._next_pos >= keyframe or gap <= READ_FORWARD_LIMIT):
+            return False
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+        self._next_pos = keyframe
+        return True
+
+    def _move_cursor(self, idx):
+        with self._wake:
+            if idx != self._cursor:
+                self._direction = 1 if idx > self._cursor else -1
+            self._cursor = idx
+            self._pending = True
+            self._wake.notify()
+
+    def _prefetch_window(self):
+        # Never prefetch more than half the cache can hold, or we evict our own work
+        frame_bytes = max(1, self.width * self.height * 3)
+        budget = max(0, self.cache.max_bytes // frame_bytes // 2 - 1)
+        ahead = min(PREFETCH_AHEAD, budget)
+        behind = min(PREFETCH_BEHIND, max(0, budget - ahead))
+        return ahead, behind
+
+    def _prefetch_order(self, cursor, direction):
+        ahead, behind = self._prefetch_window()
+        last = self.total_frames - 1
+        if direction > 0:
+            leading = range(cursor + 1, min(last, cursor + ahead) + 1)
+            trailing = range(max(0, cursor - behind), cursor)
+        else:
+            # Decode backward windows in ascending order so a single seek covers them
+            leading = range(max(0, cursor - ahead), cursor)
+            trailing = range(cursor + 1, min(last, cursor + behind) + 1)
+        return list(leading) + list(trailing)
+
+    def _prefetch_loop(self):
+        while True:
+            with self._wake:
+                while not self._closed and not self._pending:
+                    self._wake.wait()
+                if self._closed:
+                    return
+                self._pending = False
+                cursor, direction = self._cursor, self._direction
+            for idx in self._prefetch_order(cursor, direction):
+                if self._pending or self._closed:
+                    break  # cursor moved, plan again around the new position
+                if idx not in self.cache:
+                    self._decode(idx)
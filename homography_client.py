@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+from coord_io import FORMATS
+from interpolate import METHODS
+
+# Thin client for homography_daemon.py. coord_io and interpolate only import the
+# standard library at load time, so submitting a job costs no pandas/NumPy/OpenCV startup.
+
+
+def default_socket():
+    return os.environ.get("HOMOGRAPHY_SOCKET") or os.path.join(
+        tempfile.gettempdir(), f"apply_homography-{os.getuid()}.sock")
+
+
+def request(message, socket_path=None):
+    # Sends one JSON request and returns the reply, or None when no daemon is listening
+    path = socket_path or default_socket()
+    if not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    with sock, sock.makefile("rwb") as f:
+        f.write(json.dumps(message).encode() + b"\n")
+        f.flush()
+        line = f.readline()
+    if not line:
+        raise RuntimeError("The homography daemon closed the connection without replying")
+    return json.loads(line)
+
+
+def submit(original_csv, court_csv, chunksize=None, output_format=None, per_frame_h=None,
+           interpolate=None, incremental=False, socket_path=None):
+    """Runs one apply_homography job on the daemon and waits for it.
+
+    Returns (output_path, rows), or None if no daemon is running. Errors raised
+    by the job come back as RuntimeError.
+    """
+    # The daemon has its own working directory
+    absolute = lambda path: os.path.abspath(path) if path else None
+    reply = request({
+        "op": "apply", "original_csv": absolute(original_csv), "court_csv": absolute(court_csv),
+        "chunksize": chunksize, "output_format": output_format,
+        "per_frame_h": absolute(per_frame_h), "interpolate": interpolate, "incremental": incremental,
+    }, socket_path)
+    if reply is None:
+        return None
+    if not reply["ok"]:
+        raise RuntimeError(reply["error"])
+    return reply["output"], reply["rows"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Submit an apply_homography job to a running homography daemon, "
+                                                 "or run it in-process when none is running")
+    parser.add_argument("original_csv", type=str, nargs="?", help="Tagged file with _x and _y columns")
+    parser.add_argument("court_csv", type=str, nargs="?", help="Calibration file with X, Y, GrX, GrY")
+    parser.add_argument("--per_frame_h", type=str, help="Per-frame homographies (.npy) from track_homography.py")
+    parser.add_argument("--chunksize", type=int, default=None, help="Stream the input in chunks of this many rows")
+    parser.add_argument("--output_format", choices=FORMATS, default=None, help="Output format (default: same as the input)")
+    parser.add_argument("--interpolate", choices=METHODS, default=None,
+                        help="Fill the frames between sparsely tagged samples before projecting")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip unchanged files and only recompute changed chunks")
+    parser.add_argument("--socket", type=str, default=None, help="Daemon socket (default: $HOMOGRAPHY_SOCKET or a per-user path in /tmp)")
+    parser.add_argument("--status", action="store_true", help="Print the daemon's statistics and exit")
+    parser.add_argument("--stop", action="store_true", help="Stop the daemon and exit")
+    args = parser.parse_args()
+
+    if args.status or args.stop:
+        reply = request({"op": "stop" if args.stop else "stats"}, args.socket)
+        if reply is None:
+            print("No homography daemon is running")
+            sys.exit(1)
+        print(json.dumps(reply, indent=2))
+        sys.exit(0)
+    if not args.original_csv or not (args.court_csv or args.per_frame_h):
+        parser.error("original_csv and court_csv (or --per_frame_h) are required")
+
+    try:
+        result = submit(args.original_csv, args.court_csv, args.chunksize, args.output_format,
+                        args.per_frame_h, args.interpolate, args.incremental, args.socket)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if result is not None:
+        print(f"Saved transformed file to {result[0]}")
+        sys.exit(0)
+
+    # No daemon: pay the imports once and run here
+    from apply_homography import apply_homography
+    apply_homography(args.original_csv, args.court_csv, chunksize=args.chunksize,
+                     output_format=args.output_format, per_frame_h=args.per_frame_h,
+                     interpolate=args.interpolate, incremental=args.incremental)
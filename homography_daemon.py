@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+import apply_homography as ah
+from homography_client import default_socket, request
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # One JSON request per line, any number per connection
+        for line in self.rfile:
+            try:
+                reply = self.server.dispatch(json.loads(line))
+            except ValueError as e:
+                reply = {"ok": False, "error": f"Bad request: {e}"}
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+
+
+class HomographyDaemon(socketserver.UnixStreamServer):
+    """Warm apply_homography worker listening on a Unix socket.
+
+    pandas, NumPy and OpenCV are imported once, and computed calibration matrices
+    stay in apply_homography's LRU (keyed by calibration file hash) across jobs.
+    Jobs run one at a time; further clients wait in the listen backlog.
+    """
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.started = time.time()
+        self.jobs = 0
+        self.failed = 0
+        super().__init__(socket_path, _Handler)
+        os.chmod(socket_path, 0o600)
+
+    def dispatch(self, message):
+        if not isinstance(message, dict):
+            return {"ok": False, "error": "Bad request: expected a JSON object"}
+        op = message.get("op")
+        if op == "apply":
+            self.jobs += 1
+            try:
+                output, rows = ah.apply_homography(
+                    message["original_csv"], message.get("court_csv"), chunksize=message.get("chunksize"),
+                    output_format=message.get("output_format"), per_frame_h=message.get("per_frame_h"),
+                    interpolate=message.get("interpolate"), incremental=message.get("incremental", False))
+            except Exception as e:
+                self.failed += 1
+                return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            return {"ok": True, "output": output, "rows": rows}
+        if op == "stats":
+            return {"ok": True, "pid": os.getpid(), "uptime_s": round(time.time() - self.started, 1),
+                    "jobs": self.jobs, "failed": self.failed,
+                    "cached_homographies": len(ah._HOMOGRAPHY_CACHE)}
+        if op == "stop":
+            # shutdown() waits for serve_forever, so it can't run on the serving thread
+            threading.Thread(target=self.shutdown).start()
+            return {"ok": True, "stopping": os.getpid()}
+        return {"ok": False, "error": f"Unknown op {op!r}"}
+
+
+def serve(socket_path=None, cache_size=ah.HOMOGRAPHY_CACHE_SIZE):
+    socket_path = socket_path or default_socket()
+    if os.path.exists(socket_path):
+        if request({"op": "stats"}, socket_path) is not None:
+            raise RuntimeError(f"A homography daemon is already listening on {socket_path}")
+        os.unlink(socket_path)  # left behind by a daemon that died
+    ah.HOMOGRAPHY_CACHE_SIZE = cache_size
+    server = HomographyDaemon(socket_path)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    print(f"Homography daemon {os.getpid()} listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        print(f"Homography daemon stopped after {server.jobs} jobs ({server.failed} failed)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep a warm apply_homography worker on a Unix socket")
+    parser.add_argument("--socket", type=str, default=None,
+                        help="Socket path (default: $HOMOGRAPHY_SOCKET or a per-user path in /tmp)")
+    parser.add_argument("--cache_size", type=int, default=ah.HOMOGRAPHY_CACHE_SIZE,
+                        help="Calibration matrices kept in the LRU cache")
+    args = parser.parse_args()
+    try:
+        serve(args.socket, args.cache_size)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,207 @@
+import argparse
+import os
+import sys
+from annotation_store import EMPTY, MANUAL, INTERPOLATED
+from coord_io import coordinate_stems, load_table, save_table
+
+METHODS = ("linear", "cubic", "savgol")
+# Savitzky-Golay defaults: window in frames (odd) and polynomial degree
+SAVGOL_WINDOW = 31
+SAVGOL_POLYORDER = 2
+# Frames per block in the Savitzky-Golay fit, bounds its temporaries
+SAVGOL_BLOCK = 4096
+# Adaptive sampling aims for at most this much movement (pixels) between samples
+MAX_MOTION_PX = 20
+
+
+def _neighbours(known):
+    # Index of the nearest known frame at or before / at or after each cell;
+    # -1 and F where there is none
+    import numpy as np
+    F = known.shape[0]
+    idx = np.arange(F)[:, None]
+    prev = np.maximum.accumulate(np.where(known, idx, -1), axis=0)
+    nxt = np.minimum.accumulate(np.where(known, idx, F)[::-1], axis=0)[::-1]
+    return prev, nxt
+
+
+def _take(values, idx):
+    import numpy as np
+    return np.take_along_axis(values, np.clip(idx, 0, len(values) - 1), axis=0)
+
+
+def _cubic(values, prev, nxt, F):
+    # Piecewise cubic Hermite through the known samples with Catmull-Rom tangents
+    # (central differences over the neighbouring samples, one-sided at the ends)
+    import numpy as np
+    pprev = np.where(prev > 0, _take(prev, prev - 1), -1)
+    nnext = np.where(nxt < F - 1, _take(nxt, nxt + 1), F)
+    p1, p2 = _take(values, prev), _take(values, nxt)
+    h = (nxt - prev).astype(np.float64)
+    secant = (p2 - p1) / h
+    m1 = np.where(pprev >= 0, (p2 - _take(values, pprev)) / (nxt - pprev), secant)
+    m2 = np.where(nnext < F, (_take(values, nnext) - p1) / (nnext - prev), secant)
+    t = (np.arange(F)[:, None] - prev) / h
+    t2, t3 = t * t, t * t * t
+    return ((2 * t3 - 3 * t2 + 1) * p1 + (t3 - 2 * t2 + t) * h * m1
+            + (-2 * t3 + 3 * t2) * p2 + (t3 - t2) * h * m2)
+
+
+def _savgol(values, known, window, polyorder):
+    # Savitzky-Golay on irregular samples: a least-squares polynomial through the
+    # known points inside the window, evaluated at the window centre. Solved for
+    # every (frame, column) at once from windowed power sums (Hankel normal equations).
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+    F, K = values.shape
+    half = window // 2
+    order = polyorder + 1
+    u = np.arange(-half, half + 1, dtype=np.float64)
+    powers = u[None, :] ** np.arange(2 * polyorder + 1)[:, None]
+    hankel = np.add.outer(np.arange(order), np.arange(order))
+    w = np.pad(known.astype(np.float64), ((half, half), (0, 0)))
+    v = np.pad(np.where(known, values, 0.0), ((half, half), (0, 0)))
+    out = np.full((F, K), np.nan)
+    for start in range(0, F, SAVGOL_BLOCK):
+        stop = min(F, start + SAVGOL_BLOCK)
+        ww = sliding_window_view(w[start:stop + 2 * half], window, axis=0)
+        vw = sliding_window_view(v[start:stop + 2 * half], window, axis=0)
+        sums = np.einsum("fkw,jw->fkj", ww, powers)
+        rhs = np.einsum("fkw,jw->fkj", vw, powers[:order])
+        # Fewer known points than coefficients has no unique fit
+        solvable = sums[..., 0] >= order
+        normal = sums[..., hankel]
+        normal[~solvable] = np.eye(order)
+        coeffs = np.linalg.solve(normal, rhs[..., None])[..., 0]
+        out[start:stop] = np.where(solvable, coeffs[..., 0], np.nan)
+    return out
+
+
+def interpolate_tracks(values, method="linear", max_gap=None, window=SAVGOL_WINDOW,
+                       polyorder=SAVGOL_POLYORDER):
+    """Fills NaN gaps of (frames, columns) trajectories, every column at once.
+
+    Only interior gaps (a known value on both sides) of at most max_gap frames are
+    filled; nothing is extrapolated. Known values are returned unchanged.
+    Returns (filled, mask of the filled cells).
+    """
+    import numpy as np
+    if method not in METHODS:
+        raise ValueError(f"Unknown interpolation method '{method}', expected one of {METHODS}")
+    values = np.asarray(values, dtype=np.float64)
+    F = values.shape[0]
+    known = ~np.isnan(values)
+    prev, nxt = _neighbours(known)
+    gap = ~known & (prev >= 0) & (nxt < F)
+    if max_gap is not None:
+        gap &= (nxt - prev - 1) <= max_gap
+    if not gap.any():
+        return values.copy(), gap
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = (np.arange(F)[:, None] - prev) / (nxt - prev)
+        linear = _take(values, prev) + t * (_take(values, nxt) - _take(values, prev))
+        if method == "linear":
+            fill = linear
+        elif method == "cubic":
+            fill = _cubic(values, prev, nxt, F)
+        else:
+            if window % 2 == 0 or polyorder >= window:
+                raise ValueError("The Savitzky-Golay window must be odd and larger than polyorder")
+            fill = _savgol(values, known, window, polyorder)
+            # Gaps wider than the window have too few points, bridge them linearly
+            fill = np.where(np.isnan(fill), linear, fill)
+
+    filled = values.copy()
+    filled[gap] = fill[gap]
+    return filled, gap
+
+
+def interpolate_tagged(df, method="linear", max_gap=None, window=SAVGOL_WINDOW, polyorder=SAVGOL_POLYORDER):
+    """Returns a tagged table with one row per frame from the first to the last
+    tagged frame and every label's gaps filled.
+
+    {label}_flag columns mark each point: 0 not tagged, 1 tagged by hand,
+    2 propagated, 3 interpolated. Existing flags are kept.
+    """
+    import numpy as np
+    import pandas as pd
+    if "frame" not in df.columns:
+        raise ValueError("Interpolation needs a 'frame' column in the tagged file")
+    stems = sorted(coordinate_stems(df.columns), key=lambda stem: df.columns.get_loc(stem + "_x"))
+    frames = pd.to_numeric(df["frame"]).to_numpy(dtype=np.int64)
+    if len(frames) == 0 or not stems:
+        return df
+    if len(np.unique(frames)) != len(frames):
+        raise ValueError("Interpolation needs one row per frame")
+    first = frames.min()
+    dense_frames = np.arange(first, frames.max() + 1)
+    rows = frames - first
+
+    coord_cols = [f"{stem}_{axis}" for stem in stems for axis in ("x", "y")]
+    dense = np.full((len(dense_frames), len(coord_cols)), np.nan)
+    dense[rows] = df[coord_cols].to_numpy(dtype=np.float64)
+    filled, mask = interpolate_tracks(dense, method, max_gap, window, polyorder)
+
+    flag_cols = [f"{stem}_flag" for stem in stems]
+    flags = np.full((len(dense_frames), len(stems)), EMPTY, dtype=np.int64)
+    if all(col in df.columns for col in flag_cols):
+        flags[rows] = df[flag_cols].apply(pd.to_numeric).fillna(EMPTY).to_numpy(dtype=np.int64)
+    else:
+        flags[rows] = np.where(np.isnan(dense[rows, 0::2]), EMPTY, MANUAL)
+    flags[mask[:, 0::2]] = INTERPOLATED
+
+    # Other columns are carried over, empty on the added frames
+    out = df.drop(columns=coord_cols + [c for c in flag_cols if c in df.columns])
+    out = out.set_axis(rows).reindex(np.arange(len(dense_frames)))
+    out["frame"] = dense_frames
+    out = pd.concat([out,
+                     pd.DataFrame(filled, columns=coord_cols, index=out.index),
+                     pd.DataFrame(flags, columns=flag_cols, index=out.index)], axis=1)
+    columns = list(df.columns) + [c for c in flag_cols if c not in df.columns]
+    return out[columns]
+
+
+def adaptive_step(prev_points, points, gap, max_step, max_motion=MAX_MOTION_PX):
+    # Frames to the next sample so labels move about max_motion pixels, given the
+    # points ({label: (x, y)}) of the last two samples `gap` frames apart
+    import numpy as np
+    common = [lbl for lbl in points if lbl in prev_points]
+    if not common or gap <= 0:
+        return max_step
+    a = np.array([prev_points[lbl] for lbl in common], dtype=np.float64)
+    b = np.array([points[lbl] for lbl in common], dtype=np.float64)
+    speed = np.linalg.norm(b - a, axis=1).max() / gap
+    if speed == 0:
+        return max_step
+    return int(np.clip(max_motion / speed, 1, max_step))
+
+
+def interpolate_file(tagged_path, output_path=None, method="linear", max_gap=None,
+                     window=SAVGOL_WINDOW, polyorder=SAVGOL_POLYORDER):
+    if output_path is None:
+        base, ext = os.path.splitext(tagged_path)
+        output_path = base + "_interpolated" + ext
+    df = load_table(tagged_path)
+    result = interpolate_tagged(df, method, max_gap, window, polyorder)
+    save_table(result, output_path)
+    filled = int((result.filter(like="_flag") == INTERPOLATED).to_numpy().sum())
+    print(f"Interpolated {filled} points ({method}) over {len(result)} frames, saved to {output_path}")
+    return output_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill the frames between sparsely tagged samples")
+    parser.add_argument("tagged_csv", type=str, help="Tagged file (.csv, .npz or .parquet) with a frame column")
+    parser.add_argument("--output", type=str, help="Output path (default: {tagged}_interpolated.{ext})")
+    parser.add_argument("--method", choices=METHODS, default="linear", help="Interpolation method")
+    parser.add_argument("--max_gap", type=int, default=None,
+                        help="Leave gaps longer than this many frames empty")
+    parser.add_argument("--window", type=int, default=SAVGOL_WINDOW, help="Savitzky-Golay window (odd, frames)")
+    parser.add_argument("--polyorder", type=int, default=SAVGOL_POLYORDER, help="Savitzky-Golay polynomial degree")
+    args = parser.parse_args()
+    try:
+        interpolate_file(args.tagged_csv, args.output, args.method, args.max_gap, args.window, args.polyorder)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
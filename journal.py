@@ -0,0 +1,110 @@
+import json
+import os
+import queue
+import threading
+import time
+
+# Journal records are flushed to disk (fsync) at most this often
+SYNC_INTERVAL = 0.5
+MAX_BATCH = 1024
+
+_STOP = object()
+
+
+def journal_path(output_path):
+    return output_path + ".journal"
+
+
+def replay(path):
+    """Yield the records of a journal, ignoring a torn last line from a crash."""
+    try:
+        f = open(path)
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                break
+
+
+def _repair(path):
+    # Cuts the file back to the records replay() reads, so after a crash new
+    # records never continue a torn last line
+    try:
+        f = open(path, "r+b")
+    except FileNotFoundError:
+        return
+    with f:
+        valid, last = 0, b"\n"
+        for line in f:
+            try:
+                json.loads(line)
+            except ValueError:
+                break
+            valid += len(line)
+            last = line
+        f.truncate(valid)
+        if not last.endswith(b"\n"):
+            f.seek(valid)
+            f.write(b"\n")
+
+
+class Journal:
+    """Append-only log of annotation mutations.
+
+    append() only enqueues the record, so its cost does not depend on the size of
+    the session. A writer thread appends records as JSON lines in batches and
+    fsyncs at most every SYNC_INTERVAL seconds.
+    """
+
+    def __init__(self, path, sync_interval=SYNC_INTERVAL):
+        self.path = path
+        self.sync_interval = sync_interval
+        self._queue = queue.Queue()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        _repair(path)
+        self._file = open(path, "a")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def append(self, *record):
+        self._queue.put(record)
+
+    def close(self, remove=False):
+        self._queue.put(_STOP)
+        self._thread.join()
+        if remove:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+    def _run(self):
+        last_sync = time.monotonic()
+        dirty = False
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.sync_interval)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = _STOP in batch
+            records = [r for r in batch if r is not _STOP]
+            if records:
+                self._file.write("".join(json.dumps(r) + "\n" for r in records))
+                dirty = True
+            now = time.monotonic()
+            if dirty and (stop or now - last_sync >= self.sync_interval):
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                dirty = False
+                last_sync = now
+            if stop:
+                self._file.close()
+                return
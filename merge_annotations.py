@@ -0,0 +1,212 @@
+import argparse
+import csv
+import heapq
+import os
+import sys
+import time
+import warnings
+from itertools import chain, groupby
+from operator import itemgetter
+import numpy as np
+
+CONSENSUS = ("median", "mean")
+# Frames buffered before the consensus is computed and written, bounds memory
+BLOCK_FRAMES = 4096
+# Points further than this from the consensus count as a disagreement in the summary
+DISAGREEMENT_PX = 5.0
+
+
+def _header_labels(header):
+    # Labels in column order from a tagged CSV header (frame, {label}_x, {label}_y, ...)
+    columns = set(header)
+    return [col[:-2] for col in header if col.endswith("_x") and col[:-2] + "_y" in columns]
+
+
+def _stream(path, reader, header, annotator, labels):
+    # Yields (frame, annotator, (x, y, x, y, ...)) aligned to labels as text, parsed per block.
+    # Labels the file doesn't have read an empty cell appended to every row.
+    if "frame" not in header:
+        raise ValueError(f"'{path}' has no frame column")
+    frame_col = header.index("frame")
+    cols = []
+    for lbl in labels:
+        if lbl + "_x" in header:
+            cols.extend((header.index(lbl + "_x"), header.index(lbl + "_y")))
+        else:
+            cols.extend((len(header), len(header)))
+    values = itemgetter(*cols)
+    last = None
+    for row in reader:
+        if not row:
+            continue
+        frame = int(row[frame_col])
+        if last is not None and frame < last:
+            raise ValueError(f"'{path}' is not sorted by frame ({frame} after {last})")
+        last = frame
+        row.append("")
+        yield frame, annotator, values(row)
+
+
+def _parse(text, width):
+    # Rows of numeric text to a (rows, width) float array, NaN for empty cells
+    cells = chain.from_iterable(text)
+    return np.fromiter((float(c) if c else np.nan for c in cells), np.float64, len(text) * width).reshape(-1, width)
+
+
+def _cells(values):
+    # Object array of CSV cells for floats, empty where NaN
+    cells = values.astype(object)
+    cells[np.isnan(values)] = ""
+    return cells
+
+
+class _Summary:
+    # Running per-label and per-annotator disagreement totals
+    def __init__(self, labels, annotators, threshold):
+        self.threshold = threshold
+        self.frames = 0
+        self.compared = np.zeros(len(labels), dtype=np.int64)
+        self.total_px = np.zeros(len(labels))
+        self.max_px = np.zeros(len(labels))
+        self.over = np.zeros(len(labels), dtype=np.int64)
+        self.points = np.zeros(annotators, dtype=np.int64)
+        self.annotator_px = np.zeros(annotators)
+
+    def add(self, deviation, disagreement):
+        self.frames += len(disagreement)
+        compared = ~np.isnan(disagreement)
+        self.compared += compared.sum(axis=0)
+        self.total_px += np.where(compared, disagreement, 0).sum(axis=0)
+        self.max_px = np.fmax(self.max_px, np.fmax.reduce(disagreement, axis=0))
+        self.over += (disagreement > self.threshold).sum(axis=0)
+        # Only points with at least one other annotator to compare against
+        scored = ~np.isnan(deviation) & compared[:, None, :]
+        self.points += scored.sum(axis=(0, 2))
+        self.annotator_px += np.where(scored, deviation, 0).sum(axis=(0, 2))
+
+
+def merge_annotations(tagged_paths, output_path=None, report_path=None, method="median",
+                      threshold=DISAGREEMENT_PX, block_frames=BLOCK_FRAMES):
+    """Streams frame-sorted tagged CSVs from several annotators into one consensus CSV.
+
+    The files are merged on frame with heapq.merge, so only one row per file and
+    one block of frames are in memory at a time. Each label's consensus is the
+    median (or mean) of the annotators who tagged it on that frame. The report
+    has, per frame, how many annotators tagged each label and the largest
+    distance in pixels of any of them from the consensus (empty with fewer than two).
+    """
+    if method not in CONSENSUS:
+        raise ValueError(f"Unknown consensus method '{method}', expected one of {CONSENSUS}")
+    if len(tagged_paths) < 2:
+        raise ValueError("Merging needs at least two tagged files")
+    if output_path is None:
+        output_path = os.path.splitext(tagged_paths[0])[0] + "_merged.csv"
+    if report_path is None:
+        report_path = os.path.splitext(output_path)[0] + "_disagreement.csv"
+
+    start_time = time.perf_counter()
+    files = [open(path, newline="") for path in tagged_paths]
+    temp_paths = (output_path + ".tmp", report_path + ".tmp")
+    try:
+        readers = [csv.reader(f) for f in files]
+        headers = [next(reader, []) for reader in readers]
+        labels = []
+        for header in headers:
+            labels.extend(lbl for lbl in _header_labels(header) if lbl not in labels)
+        if not labels:
+            raise ValueError("No {label}_x / {label}_y columns found in the tagged files")
+        k, L = len(files), len(labels)
+        merged = heapq.merge(*[_stream(path, reader, header, a, labels)
+                               for a, (path, reader, header) in enumerate(zip(tagged_paths, readers, headers))],
+                             key=itemgetter(0))
+        summary = _Summary(labels, k, threshold)
+
+        # Write next to the targets and rename, so a failure never leaves truncated files
+        with open(temp_paths[0], "w", newline="") as out, open(temp_paths[1], "w", newline="") as rep:
+            out_writer, rep_writer = csv.writer(out), csv.writer(rep)
+            out_writer.writerow(["frame"] + [f"{lbl}_{axis}" for lbl in labels for axis in ("x", "y")])
+            rep_writer.writerow(["frame", "annotators", "max_px", "worst_label"]
+                                + [f"{lbl}_{col}" for lbl in labels for col in ("n", "px")])
+            frames, rows, annotators, text = [], [], [], []
+
+            def flush():
+                n = len(frames)
+                points = np.full((n, k, L, 2), np.nan)
+                points[rows, annotators] = _parse(text, 2 * L).reshape(-1, L, 2)
+                present = np.zeros((n, k), dtype=bool)
+                present[rows, annotators] = True
+                with warnings.catch_warnings():
+                    # All-NaN slices (a label nobody tagged on a frame) stay NaN
+                    warnings.simplefilter("ignore", RuntimeWarning)
+                    consensus = np.nanmedian(points, axis=1) if method == "median" else np.nanmean(points, axis=1)
+                deviation = np.linalg.norm(points - consensus[:, None], axis=-1)
+                counts = (~np.isnan(deviation)).sum(axis=1)
+                disagreement = np.where(counts >= 2, np.fmax.reduce(deviation, axis=1), np.nan)
+                summary.add(deviation, disagreement)
+
+                frame_max = np.fmax.reduce(disagreement, axis=1)
+                worst = np.array(labels, dtype=object)[np.argmax(np.nan_to_num(disagreement, nan=-1.0), axis=1)]
+                worst[np.isnan(frame_max)] = ""
+                out_rows = np.empty((n, 1 + 2 * L), dtype=object)
+                out_rows[:, 0] = frames
+                out_rows[:, 1:] = _cells(np.round(consensus.reshape(n, 2 * L), 3))
+                out_writer.writerows(out_rows.tolist())
+                rep_rows = np.empty((n, 4 + 2 * L), dtype=object)
+                rep_rows[:, 0] = frames
+                rep_rows[:, 1] = present.sum(axis=1)
+                rep_rows[:, 2] = _cells(np.round(frame_max, 3))
+                rep_rows[:, 3] = worst
+                rep_rows[:, 4::2] = counts
+                rep_rows[:, 5::2] = _cells(np.round(disagreement, 3))
+                rep_writer.writerows(rep_rows.tolist())
+                for buffer in (frames, rows, annotators, text):
+                    buffer.clear()
+
+            for frame, group in groupby(merged, key=itemgetter(0)):
+                for _, a, values in group:
+                    rows.append(len(frames))
+                    annotators.append(a)
+                    text.append(values)
+                frames.append(frame)
+                if len(frames) == block_frames:
+                    flush()
+            if frames:
+                flush()
+        os.replace(temp_paths[0], output_path)
+        os.replace(temp_paths[1], report_path)
+    finally:
+        for f in files:
+            f.close()
+        for path in temp_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Merged {k} annotators over {summary.frames} frames ({method}) in {elapsed:.1f}s")
+    print(f"{'label':<20}{'compared':>10}{'mean px':>10}{'max px':>10}{f'> {threshold:g} px':>10}")
+    for j, lbl in enumerate(labels):
+        mean = summary.total_px[j] / summary.compared[j] if summary.compared[j] else float("nan")
+        print(f"{lbl:<20}{summary.compared[j]:>10}{mean:>10.2f}{summary.max_px[j]:>10.2f}{summary.over[j]:>10}")
+    for a, path in enumerate(tagged_paths):
+        if summary.points[a]:
+            print(f"{path}: {summary.annotator_px[a] / summary.points[a]:.2f} px mean distance "
+                  f"from consensus over {summary.points[a]} points")
+    print(f"Saved consensus to {output_path} and disagreement report to {report_path}")
+    return output_path, report_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge tagged CSVs from several annotators into a consensus "
+                                                 "file with a per-frame disagreement report")
+    parser.add_argument("tagged_csvs", type=str, nargs="+", help="Tagged CSVs from video_tagger.py, sorted by frame")
+    parser.add_argument("--output", type=str, help="Consensus CSV (default: {first tagged}_merged.csv)")
+    parser.add_argument("--report", type=str, help="Disagreement report (default: {output}_disagreement.csv)")
+    parser.add_argument("--method", choices=CONSENSUS, default="median", help="How annotators' points are combined")
+    parser.add_argument("--threshold", type=float, default=DISAGREEMENT_PX,
+                        help="Pixels from the consensus counted as a disagreement in the summary")
+    args = parser.parse_args()
+    try:
+        merge_annotations(args.tagged_csvs, args.output, args.report, args.method, args.threshold)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
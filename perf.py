@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Samples kept per stage for the rolling percentiles
+WINDOW = 200
+# Upper bound on buffered trace events, so a forgotten trace cannot exhaust memory
+MAX_TRACE_EVENTS = 1_000_000
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class Profiler:
+    """Timing for named stages of the UI hot paths.
+
+    Use `with profiler.stage("decode"): ...`. While disabled, stage() returns a
+    shared no-op context manager, so instrumentation costs one method call.
+    When tracing, every stage is also kept as a Chrome trace event
+    (chrome://tracing, Perfetto) for dump_trace().
+    """
+
+    def __init__(self, enabled=False, trace=False, window=WINDOW):
+        self.enabled = enabled or trace
+        self.tracing = trace
+        self.window = window
+        self._samples = {}
+        self._events = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name, start, end):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(end - start)
+            if self.tracing and len(self._events) < MAX_TRACE_EVENTS:
+                self._events.append({
+                    "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                    "ts": (start - self._origin) * 1e6, "dur": (end - start) * 1e6,
+                })
+
+    def summary(self):
+        # {stage: (p50_ms, p95_ms, samples)} over the rolling window
+        with self._lock:
+            snapshot = {name: sorted(samples) for name, samples in self._samples.items()}
+        result = {}
+        for name, times in snapshot.items():
+            if times:
+                result[name] = (1000 * times[len(times) // 2],
+                                1000 * times[min(len(times) - 1, int(0.95 * len(times)))],
+                                len(times))
+        return result
+
+    def format_summary(self):
+        return "\n".join(f"{name:<11}p50 {p50:6.2f}  p95 {p95:6.2f} ms"
+                         for name, (p50, p95, _) in self.summary().items())
+
+    def dump_trace(self, path):
+        with self._lock:
+            events = list(self._events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print(f"Saved {len(events)} trace events to {path}")
+
+
+NULL_PROFILER = Profiler()
+
+
+class PerfHud:
+    """Rolling per-stage percentiles drawn in the corner of a Tk canvas."""
+
+    def __init__(self, root, canvas, profiler, interval_ms=500):
+        self.root = root
+        self.canvas = canvas
+        self.profiler = profiler
+        self.interval_ms = interval_ms
+        self._bg = None
+        self._text = None
+        self._job = None
+
+    @property
+    def visible(self):
+        return self._text is not None
+
+    def toggle(self):
+        if self.visible:
+            self.hide()
+        else:
+            self.show()
+
+    def show(self):
+        self.profiler.enabled = True
+        self._bg = self.canvas.create_rectangle(0, 0, 0, 0, fill="black", stipple="gray50",
+                                                outline="", tags=("hud",))
+        self._text = self.canvas.create_text(6, 6, anchor="nw", fill="#ffff00",
+                                             font=("TkFixedFont", 9), tags=("hud",))
+        self.refresh()
+
+    def hide(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+        self.canvas.delete("hud")
+        self._bg = self._text = None
+        # Keep measuring if a trace is being recorded
+        self.profiler.enabled = self.profiler.tracing
+
+    def refresh(self):
+        if not self.visible:
+            return
+        self.canvas.itemconfig(self._text, text=self.profiler.format_summary() or "waiting for samples")
+        bbox = self.canvas.bbox(self._text)
+        if bbox:
+            self.canvas.coords(self._bg, bbox[0] - 4, bbox[1] - 4, bbox[2] + 4, bbox[3] + 4)
+        self.canvas.tag_raise("hud")
+        self._job = self.root.after(self.interval_ms, self.refresh)
@@ -0,0 +1,144 @@
+import queue
+import threading
+import time
+from collections import deque
+from rendering import to_display
+
+PLAYBACK_SPEEDS = (0.25, 0.5, 1.0, 1.5, 2.0, 4.0)
+# Display-ready frames buffered between the decoder thread and the UI
+QUEUE_SIZE = 8
+
+_END = object()
+
+
+class PlaybackClock:
+    """Maps wall-clock time to the frame that should be on screen."""
+
+    def __init__(self, fps):
+        self.fps = fps
+        self._lock = threading.Lock()
+        self.start(0, 1.0)
+
+    def start(self, frame_idx, speed):
+        with self._lock:
+            self.origin_idx = frame_idx
+            self.origin_time = time.perf_counter()
+            self.speed = speed
+
+    def due_index(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self.origin_time
+            return self.origin_idx + int(elapsed * self.fps * self.speed)
+
+    def seconds_until(self, frame_idx):
+        with self._lock:
+            target = self.origin_time + (frame_idx - self.origin_idx) / (self.fps * self.speed)
+        return target - time.perf_counter()
+
+
+class Player:
+    """Real-time playback with decoding decoupled from presentation.
+
+    A decoder thread reads sequentially from its own capture and fills a bounded
+    queue with display-ready frames. The UI thread calls poll() on a timer and
+    gets the newest frame that is due, dropping frames that arrived too late.
+    Frames that are already late when decoded are skipped without conversion.
+    """
+
+    def __init__(self, video_path, fps, total_frames, start_idx, display_size,
+                 speed=1.0, prepare=None, queue_size=QUEUE_SIZE):
+        self.video_path = video_path
+        self.total_frames = total_frames
+        self.start_idx = start_idx
+        self.display_size = display_size
+        self.prepare = prepare or (lambda idx, frame: to_display(frame, display_size))
+        self.clock = PlaybackClock(fps)
+        self.clock.start(start_idx, speed)
+
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.finished = False
+        self.presented = 0
+        self.dropped = 0
+        self.skipped = 0
+        self._held = None
+        self._present_times = deque(maxlen=120)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._decode_loop, daemon=True)
+
+    @property
+    def target_fps(self):
+        return self.clock.fps * self.clock.speed
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def set_speed(self, speed, current_idx):
+        self.clock.start(current_idx, speed)
+
+    def poll(self):
+        """Return (frame_idx, image) of the newest due frame, or None if nothing is due."""
+        due = self.clock.due_index()
+        latest = None
+        while True:
+            if self._held is None:
+                try:
+                    self._held = self.frames.get_nowait()
+                except queue.Empty:
+                    break
+            if self._held is _END:
+                self.finished = latest is None
+                break
+            if self._held[0] > due:
+                break
+            if latest is not None:
+                self.dropped += 1
+            latest, self._held = self._held, None
+        if latest is not None:
+            self.presented += 1
+            self._present_times.append(time.perf_counter())
+        return latest
+
+    def delay_ms(self):
+        # Time until the next frame is due, polled a little early to absorb timer jitter
+        next_idx = self._held[0] if isinstance(self._held, tuple) else self.clock.due_index() + 1
+        return max(1, int(self.clock.seconds_until(next_idx) * 1000) - 2)
+
+    def achieved_fps(self):
+        times = self._present_times
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self.frames.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _decode_loop(self):
+        import cv2
+        cap = cv2.VideoCapture(self.video_path)
+        try:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_idx)
+            idx = self.start_idx
+            while not self._stop.is_set() and idx < self.total_frames:
+                if idx < self.clock.due_index():
+                    # Already late: advance the decoder but skip retrieve/resize
+                    if not cap.grab():
+                        break
+                    self.skipped += 1
+                else:
+                    ret, frame = cap.read()
+                    if not ret or not self._put((idx, self.prepare(idx, frame))):
+                        break
+                idx += 1
+        finally:
+            cap.release()
+            self._put(_END)
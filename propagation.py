@@ -0,0 +1,110 @@
+import queue
+import threading
+
+# Frames to track ahead of the annotated frame by default
+DEFAULT_PROPAGATE_FRAMES = 10
+# Forward-backward error (source pixels) above which a tracked point counts as lost
+FB_THRESHOLD = 2.0
+LK_PARAMS = dict(winSize=(21, 21), maxLevel=3)
+# Lucas-Kanade stops after this many iterations or once a step moves less than this
+LK_ITERATIONS = 30
+LK_EPSILON = 0.01
+
+
+class Propagator:
+    """Tracks labelled points forward with pyramidal Lucas-Kanade on a worker thread.
+
+    Frames come from the shared FrameSource, so anything the tagger already
+    decoded is reused. Results are queued as (job_id, frame, {label: (x, y) or None})
+    for the UI thread to drain with poll(); None means the point was lost at that
+    frame (failed status or forward-backward check) and is no longer tracked.
+    Submitting a new job cancels the previous one.
+    """
+
+    def __init__(self, source, fb_threshold=FB_THRESHOLD):
+        self.source = source
+        self.fb_threshold = fb_threshold
+        self.results = queue.Queue()
+        self._job_id = 0
+        self._cancel = threading.Event()
+        self._thread = None
+
+    @property
+    def busy(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, start_frame, points, num_frames, anchors=None):
+        # points: {label: (x, y)} on start_frame; anchors: {(frame, label): (x, y)} of
+        # hand-tagged points ahead, which re-seed tracking instead of being overwritten
+        self.cancel()
+        self._job_id += 1
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(
+            target=self._track, daemon=True,
+            args=(self._job_id, start_frame, dict(points), num_frames, dict(anchors or {}), self._cancel))
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def poll(self):
+        # Results of the current job only; anything from a cancelled job is dropped
+        out = []
+        while True:
+            try:
+                job_id, frame, points = self.results.get_nowait()
+            except queue.Empty:
+                return out
+            if job_id == self._job_id:
+                out.append((frame, points))
+
+    def _gray(self, idx):
+        import cv2
+        frame = self.source.get_frame(idx, move_cursor=False)
+        return None if frame is None else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def _track(self, job_id, start_frame, points, num_frames, anchors, cancel):
+        import numpy as np
+        import cv2
+        labels = list(points)
+        if not labels:
+            return
+        prev = self._gray(start_frame)
+        if prev is None:
+            return
+        # Points are in original-resolution pixels; frames may come from a smaller proxy
+        scale = np.array([prev.shape[1] / self.source.width, prev.shape[0] / self.source.height],
+                         dtype=np.float32)
+        pts = (np.array([points[lbl] for lbl in labels], dtype=np.float32) * scale).reshape(-1, 1, 2)
+        alive = np.ones(len(labels), dtype=bool)
+        lk_params = dict(LK_PARAMS, criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT,
+                                              LK_ITERATIONS, LK_EPSILON))
+        last = min(start_frame + num_frames, self.source.total_frames - 1)
+        for frame in range(start_frame + 1, last + 1):
+            if cancel.is_set():
+                return
+            cur = self._gray(frame)
+            if cur is None:
+                return
+            nxt, status, _ = cv2.calcOpticalFlowPyrLK(prev, cur, pts, None, **lk_params)
+            back, back_status, _ = cv2.calcOpticalFlowPyrLK(cur, prev, nxt, None, **lk_params)
+            fb_error = np.linalg.norm((pts - back).reshape(-1, 2), axis=1)
+            alive &= (status.ravel() == 1) & (back_status.ravel() == 1) & (fb_error < self.fb_threshold)
+
+            result = {}
+            for i, lbl in enumerate(labels):
+                anchor = anchors.get((frame, lbl))
+                if anchor is not None:
+                    nxt[i, 0] = np.asarray(anchor, dtype=np.float32) * scale
+                    alive[i] = True
+                elif alive[i]:
+                    x, y = nxt[i, 0] / scale
+                    result[lbl] = (int(round(x)), int(round(y)))
+                else:
+                    result[lbl] = None
+            if cancel.is_set():
+                return
+            self.results.put((job_id, frame, result))
+            if not alive.any():
+                return
+            pts, prev = nxt, cur
@@ -0,0 +1,173 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from frame_source import FrameSource, KeyframeIndex, DEFAULT_CACHE_MB, chunk_ranges, read_frames
+
+# Size of the taggers' frame canvas
+PROXY_DISPLAY_SIZE = (800, 450)
+PROXY_KINDS = ("display", "full")
+# Frames per worker task while building
+CHUNK_FRAMES = 500
+
+
+def meta_path(video_path):
+    return video_path + ".proxy.json"
+
+
+def proxy_path(video_path, kind):
+    return f"{video_path}.proxy_{kind}.npy"
+
+
+def load_meta(video_path):
+    # The proxy metadata if it matches the video's current size and mtime, else None
+    st = os.stat(video_path)
+    try:
+        with open(meta_path(video_path)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("size") != st.st_size or meta.get("mtime_ns") != st.st_mtime_ns:
+        return None
+    return meta
+
+
+def _fill_chunk(video_path, start, stop, keyframe, targets):
+    # Worker: decodes frames start..stop-1 into every (path, size) target memmap.
+    # Returns the number of frames actually decoded.
+    import numpy as np
+    import cv2
+    arrays = [(np.load(path, mmap_mode="r+"), size) for path, size in targets]
+    written = 0
+    for idx, frame in read_frames(video_path, start, stop, keyframe):
+        for array, size in arrays:
+            array[idx] = frame if size is None else cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        written += 1
+    for array, _ in arrays:
+        array.flush()
+    return written
+
+
+def prepare_proxy(video_path, kinds=("display",), workers=None):
+    """Transcodes the video once into raw uint8 BGR frame arrays next to it.
+
+    Each kind is an .npy (so the memmap carries its own shape/dtype header) of
+    shape (frames, height, width, 3): "display" at PROXY_DISPLAY_SIZE, "full" at
+    the original resolution. Existing, up to date proxies are kept.
+    """
+    import numpy as np
+    import cv2
+    meta = load_meta(video_path) or {}
+    missing = [k for k in kinds if k not in meta.get("proxies", {}) or not os.path.exists(proxy_path(video_path, k))]
+    if not missing:
+        return meta
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video '{video_path}'")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+
+    sizes = {"display": PROXY_DISPLAY_SIZE, "full": (width, height)}
+    needed = sum(total_frames * sizes[k][0] * sizes[k][1] * 3 for k in missing)
+    free = shutil.disk_usage(os.path.dirname(os.path.abspath(video_path))).free
+    if needed > free:
+        raise RuntimeError(f"The proxy needs {needed / 1e9:.1f} GB but only {free / 1e9:.1f} GB is free")
+    print(f"Building {', '.join(missing)} proxy for {video_path} ({needed / 1e9:.1f} GB)")
+
+    targets = []
+    for kind in missing:
+        w, h = sizes[kind]
+        path = proxy_path(video_path, kind)
+        np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(total_frames, h, w, 3)).flush()
+        targets.append((path, None if kind == "full" else (w, h)))
+
+    start_time = time.perf_counter()
+    keyframes = KeyframeIndex.load_or_build(video_path)
+    frames = 0
+    # spawn rather than fork: the taggers call this from their loader thread while
+    # the main thread holds a Tk connection
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [(start, pool.submit(_fill_chunk, video_path, start, stop,
+                                       keyframes.preceding(start) if keyframes else start, targets))
+                   for start, stop in chunk_ranges(total_frames, CHUNK_FRAMES)]
+        for start, future in futures:
+            written = future.result()
+            if written:
+                frames = max(frames, start + written)
+    elapsed = time.perf_counter() - start_time
+    print(f"Wrote {frames} frames in {elapsed:.1f}s ({frames / elapsed:.0f} frames/s)")
+
+    # Frame counts reported by containers are estimates; frames beyond the last
+    # decoded one are never served
+    st = os.stat(video_path)
+    proxies = meta.get("proxies", {}) if meta.get("frames") == frames else {}
+    proxies.update({k: {"width": sizes[k][0], "height": sizes[k][1]} for k in missing})
+    meta = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "width": width, "height": height,
+            "fps": fps, "frames": frames, "proxies": proxies}
+    with open(meta_path(video_path), "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+class ProxyFrameSource:
+    """Drop-in for FrameSource that serves frames from a raw proxy without decoding.
+
+    get_frame() returns a read-only view into the memmap (no copy, no decode);
+    width/height are those of the original video so coordinates stay in
+    original-resolution pixels even when the proxy is smaller.
+    """
+
+    def __init__(self, video_path, kind="display"):
+        import numpy as np
+        meta = load_meta(video_path)
+        if meta is None or kind not in meta["proxies"]:
+            raise RuntimeError(f"No up to date {kind} proxy for '{video_path}', run proxy.py first")
+        self.video_path = video_path
+        self.frames = np.load(proxy_path(video_path, kind), mmap_mode="r")
+        self.total_frames = meta["frames"]
+        self.fps = meta["fps"]
+        self.width = meta["width"]
+        self.height = meta["height"]
+
+    def get_frame(self, idx, move_cursor=True):
+        if idx < 0 or idx >= self.total_frames:
+            return None
+        return self.frames[idx]
+
+    def is_cached(self, idx):
+        return True
+
+    def close(self):
+        self.frames = None
+
+
+def open_frame_source(video_path, cache_mb=DEFAULT_CACHE_MB, proxy=None):
+    # A FrameSource, or with proxy="display"/"full" a ProxyFrameSource, building the proxy if needed
+    if proxy is None:
+        return FrameSource(video_path, cache_mb=cache_mb)
+    prepare_proxy(video_path, (proxy,))
+    return ProxyFrameSource(video_path, proxy)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcode a video into a raw memory-mapped proxy "
+                                                 "for decode-free tagging")
+    parser.add_argument("video_path", type=str, help="Path to video file")
+    parser.add_argument("--full", action="store_true",
+                        help="Also build a proxy at the original resolution")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: number of CPUs)")
+    args = parser.parse_args()
+    try:
+        prepare_proxy(args.video_path, PROXY_KINDS if args.full else ("display",), args.workers)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,328 @@
+from PIL import Image, ImageTk
+from frame_source import FrameCache
+from perf import NULL_PROFILER
+
+# Memory budget for resized, display-ready frames
+DISPLAY_CACHE_MB = 64
+# Zoom stops when one source pixel covers this many canvas pixels
+MAX_PIXEL_SIZE = 12
+# Zoom factor per mouse wheel step
+ZOOM_STEP = 1.25
+
+
+def to_display(frame, size):
+    import cv2
+    resized = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+
+
+def disable_controls(widget):
+    # Disables every control under widget (canvases excepted) while the video opens;
+    # returns [(control, previous state)] for enable_controls
+    disabled = []
+    for child in widget.winfo_children():
+        if "state" in child.keys() and child.winfo_class() != "Canvas":
+            disabled.append((child, str(child.cget("state"))))
+            child.configure(state="disabled")
+        disabled.extend(disable_controls(child))
+    return disabled
+
+
+def enable_controls(disabled):
+    for widget, state in disabled:
+        widget.configure(state=state)
+
+
+class Viewport:
+    """The part of the source frame shown on the canvas, for zoom and pan.
+
+    The region is whole source pixels (x0, y0, width, height) stretched over the
+    canvas, so to_source(to_canvas(x, y)) gives back the same pixel at any zoom.
+    Only the region is cropped and resized, so zooming into a 4K frame costs no
+    more than showing it whole.
+    """
+
+    def __init__(self, canvas_size, max_pixel_size=MAX_PIXEL_SIZE):
+        self.canvas_size = tuple(canvas_size)
+        self.max_pixel_size = max_pixel_size
+        self.source_size = None
+        # One tuple, replaced whole, so the playback thread never sees half an update
+        self.region = None
+        self._pan_start = None
+
+    def set_source(self, width, height):
+        self.source_size = (width, height)
+        self.reset()
+
+    @property
+    def zoomed(self):
+        return self.region[2:] != self.source_size
+
+    def reset(self):
+        old = self.region
+        self.region = (0, 0) + self.source_size
+        return self.region != old
+
+    def _move(self, x0, y0, w, h):
+        # Clamps the region to the frame and returns whether it changed
+        W, H = self.source_size
+        w, h = min(max(1, w), W), min(max(1, h), H)
+        old = self.region
+        self.region = (min(max(0, x0), W - w), min(max(0, y0), H - h), w, h)
+        return self.region != old
+
+    def zoom_at(self, cx, cy, factor):
+        # Zooms by factor keeping the source point under canvas (cx, cy) in place
+        (W, H), (cw, ch) = self.source_size, self.canvas_size
+        x0, y0, w, h = self.region
+        px, py = x0 + cx * w / cw, y0 + cy * h / ch
+        zoom = min(W / w * factor, W * self.max_pixel_size / cw)
+        zoom = max(zoom, 1.0)
+        w, h = round(W / zoom), round(H / zoom)
+        return self._move(round(px - cx * w / cw), round(py - cy * h / ch), w, h)
+
+    def start_pan(self, cx, cy):
+        self._pan_start = (cx, cy, self.region)
+
+    def pan_to(self, cx, cy):
+        # Drags the region with the cursor, measured from start_pan so slow drags still move
+        if self._pan_start is None:
+            return False
+        sx, sy, (x0, y0, w, h) = self._pan_start
+        cw, ch = self.canvas_size
+        return self._move(round(x0 - (cx - sx) * w / cw), round(y0 - (cy - sy) * h / ch), w, h)
+
+    def to_canvas(self, x, y):
+        x0, y0, w, h = self.region
+        cw, ch = self.canvas_size
+        return (x - x0) * cw / w, (y - y0) * ch / h
+
+    def to_source(self, cx, cy):
+        # The source pixel under canvas point (cx, cy)
+        x0, y0, w, h = self.region
+        cw, ch = self.canvas_size
+        return (x0 + min(max(0, int(cx * w / cw)), w - 1),
+                y0 + min(max(0, int(cy * h / ch)), h - 1))
+
+    def crop(self, frame):
+        # The region of frame, which may be a smaller proxy of the source
+        x0, y0, w, h = self.region
+        W, H = self.source_size
+        fh, fw = frame.shape[:2]
+        if (fw, fh) == (W, H):
+            return frame[y0:y0 + h, x0:x0 + w]
+        left, top = x0 * fw // W, y0 * fh // H
+        right, bottom = -(-(x0 + w) * fw // W), -(-(y0 + h) * fh // H)
+        return frame[top:max(bottom, top + 1), left:max(right, left + 1)]
+
+    def resize(self, frame, interpolation=None):
+        # Region of frame at canvas size, in frame's own channel order. Enlarged
+        # zoomed regions use nearest neighbour so source pixels stay sharp squares.
+        import cv2
+        crop = self.crop(frame)
+        if crop.shape[1::-1] == self.canvas_size:
+            return crop
+        if interpolation is None:
+            enlarging = self.zoomed and crop.shape[1] < self.canvas_size[0]
+            interpolation = cv2.INTER_NEAREST if enlarging else cv2.INTER_AREA
+        return cv2.resize(crop, self.canvas_size, interpolation=interpolation)
+
+    def render(self, frame_bgr):
+        import cv2
+        return cv2.cvtColor(self.resize(frame_bgr), cv2.COLOR_BGR2RGB)
+
+
+def bind_viewport(canvas, viewport, changed):
+    # Mouse wheel zooms at the cursor, right or middle drag pans, Escape shows the
+    # whole frame; changed() is called whenever the region moved
+    def zoom(event):
+        # event.delta on Windows and macOS, buttons 4 and 5 on X11
+        factor = ZOOM_STEP if event.num == 4 or event.delta > 0 else 1 / ZOOM_STEP
+        if viewport.zoom_at(event.x, event.y, factor):
+            changed()
+
+    def pan(event):
+        if viewport.pan_to(event.x, event.y):
+            changed()
+
+    canvas.bind("<MouseWheel>", zoom)
+    canvas.bind("<Button-4>", zoom)
+    canvas.bind("<Button-5>", zoom)
+    for button in (2, 3):
+        canvas.bind(f"<ButtonPress-{button}>", lambda event: viewport.start_pan(event.x, event.y))
+        canvas.bind(f"<B{button}-Motion>", pan)
+    canvas.winfo_toplevel().bind("<Escape>", lambda event: viewport.reset() and changed())
+
+
+class DisplayCache:
+    """Display-ready (resized RGB) frames, converted once per frame and size.
+
+    With a viewport, frames show its region and are cached per frame and region.
+    """
+
+    def __init__(self, size, max_mb=DISPLAY_CACHE_MB, profiler=NULL_PROFILER, viewport=None):
+        self.size = size
+        self.profiler = profiler
+        self.viewport = viewport
+        self._frames = FrameCache(int(max_mb * 1024 * 1024))
+
+    def get(self, frame_idx, frame_bgr):
+        import cv2
+        key = frame_idx if self.viewport is None else (frame_idx, self.viewport.region)
+        rgb = self._frames.get(key)
+        if rgb is None:
+            with self.profiler.stage("resize"):
+                if self.viewport is not None:
+                    resized = self.viewport.resize(frame_bgr)
+                # Display-resolution proxy frames need no resize
+                elif frame_bgr.shape[1::-1] == tuple(self.size):
+                    resized = frame_bgr
+                else:
+                    resized = cv2.resize(frame_bgr, self.size, interpolation=cv2.INTER_AREA)
+            with self.profiler.stage("convert"):
+                rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+            self._frames.put(key, rgb)
+        return rgb
+
+
+class OverlayLayer:
+    """Annotation markers drawn as canvas items on top of the frame image.
+
+    Each marker is an oval plus a text label identified by a key, so adding,
+    moving or removing one point touches only its own items. Positions are given
+    in source pixels and mapped to the canvas with to_canvas(x, y).
+    """
+
+    def __init__(self, canvas, to_canvas, radius=4, fill="#00ff00", text_fill="#ff0000",
+                 font=("TkDefaultFont", 9)):
+        self.canvas = canvas
+        self.to_canvas = to_canvas
+        self.radius = radius
+        self.fill = fill
+        self.text_fill = text_fill
+        self.font = font
+        self._items = {}  # key -> (oval_id, text_id, x, y, text)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def set(self, key, x, y, text, fill=None):
+        fill = fill or self.fill
+        item = self._items.get(key)
+        if item is not None and item[2:] == (x, y, text, fill):
+            return
+        cx, cy = self.to_canvas(x, y)
+        r = self.radius
+        if item is None:
+            oval = self.canvas.create_oval(cx - r, cy - r, cx + r, cy + r, fill=fill,
+                                           outline="", tags=("overlay",))
+            label = self.canvas.create_text(cx + r + 1, cy - r - 1, text=text, anchor="sw",
+                                            fill=self.text_fill, font=self.font, tags=("overlay",))
+        else:
+            oval, label = item[0], item[1]
+            self.canvas.coords(oval, cx - r, cy - r, cx + r, cy + r)
+            self.canvas.coords(label, cx + r + 1, cy - r - 1)
+            if item[4] != text:
+                self.canvas.itemconfig(label, text=text)
+            if item[5] != fill:
+                self.canvas.itemconfig(oval, fill=fill)
+        self._items[key] = (oval, label, x, y, text, fill)
+
+    def remove(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.canvas.delete(item[0], item[1])
+
+    def clear(self):
+        for key in list(self._items):
+            self.remove(key)
+
+    def sync(self, markers):
+        # markers: {key: (x, y, text[, fill])}; only differences are applied to the canvas
+        for key in [k for k in self._items if k not in markers]:
+            self.remove(key)
+        for key, marker in markers.items():
+            self.set(key, *marker)
+
+    def relayout(self):
+        # Re-map every marker after the source-to-canvas mapping changed
+        for key, (oval, label, x, y, text, fill) in list(self._items.items()):
+            del self._items[key]
+            self.canvas.delete(oval, label)
+            self.set(key, x, y, text, fill)
+
+
+class Filmstrip:
+    """Row of thumbnails from a ThumbnailStrip, centred on the current position.
+
+    The visible thumbnails are composed into a single image, and it is only rebuilt
+    when the centre thumbnail, the number of available thumbnails or the canvas
+    width changes, so it can follow a slider drag or playback cheaply.
+    """
+
+    def __init__(self, canvas, strip, marker="#ff0000"):
+        self.canvas = canvas
+        self.strip = strip
+        self.marker = marker
+        self._key = None
+        self._first = 0
+        self._x0 = 0
+        self._img = None
+        self._img_id = None
+        self._marker_id = None
+        self._text_id = None
+
+    def show(self, frame_idx):
+        import numpy as np
+        strip = self.strip
+        width = self.canvas.winfo_width()
+        if width <= 1:
+            width = int(self.canvas["width"])
+        tw, th = strip.thumb_width, strip.thumb_height
+        n = width // tw + 3
+        n += 1 - n % 2  # odd, so one thumbnail sits in the middle
+        center = strip.index_for(frame_idx)
+        first = center - n // 2
+        available = strip.available()
+        key = (center, min(available, first + n), width)
+        if key == self._key:
+            return
+        self._key = key
+        self._first = first
+        self._x0 = width // 2 - (n // 2) * tw - tw // 2
+
+        row = np.full((th, n * tw, 3), 32, dtype=np.uint8)
+        lo, hi = max(0, first), min(available, first + n)
+        if hi > lo:
+            # (k, h, w, 3) -> (h, k * w, 3)
+            row[:, (lo - first) * tw:(hi - first) * tw] = \
+                strip.thumbs[lo:hi].transpose(1, 0, 2, 3).reshape(th, (hi - lo) * tw, 3)
+        self._img = ImageTk.PhotoImage(Image.fromarray(row))
+        cx = width // 2 - tw // 2
+        if self._img_id is None:
+            self._img_id = self.canvas.create_image(self._x0, 0, anchor="nw", image=self._img)
+            self._marker_id = self.canvas.create_rectangle(cx, 0, cx + tw - 1, th - 1,
+                                                           outline=self.marker, width=2)
+            self._text_id = self.canvas.create_text(4, th // 2, anchor="w", fill="#ffffff")
+        else:
+            self.canvas.coords(self._img_id, self._x0, 0)
+            self.canvas.itemconfig(self._img_id, image=self._img)
+            self.canvas.coords(self._marker_id, cx, 0, cx + tw - 1, th - 1)
+        building = available < strip.count and strip.building
+        self.canvas.itemconfig(self._text_id, text=(
+            f"Building thumbnails {100 * available // max(1, strip.count)}%" if building else ""))
+
+    def frame_at(self, x):
+        # Frame shown by the thumbnail under canvas x
+        i = self._first + (x - self._x0) // self.strip.thumb_width
+        return min(self.strip.total_frames - 1, max(0, i * self.strip.step))
+
+    def preview(self, frame_idx, size, viewport=None):
+        # The nearest thumbnail (or its viewport region) scaled up to `size`, or None if it isn't built yet
+        import cv2
+        thumb = self.strip.get(frame_idx)
+        if thumb is None:
+            return None
+        if viewport is not None:
+            return viewport.resize(thumb, cv2.INTER_LINEAR)
+        return cv2.resize(thumb, size, interpolation=cv2.INTER_LINEAR)
@@ -0,0 +1,130 @@
+import json
+import multiprocessing
+import os
+
+THUMB_HEIGHT = 54
+# Thumbnails taken per second of video
+THUMBS_PER_SECOND = 1
+
+
+def build_thumbnails(video_path, thumbs_path, step, progress):
+    # Runs in a child process: decodes the video once, filling the memmap in order
+    # and publishing the number of finished thumbnails through `progress`
+    import numpy as np
+    import cv2
+    thumbs = np.load(thumbs_path, mmap_mode="r+")
+    count, height, width = thumbs.shape[:3]
+    cap = cv2.VideoCapture(video_path)
+    try:
+        idx = 0
+        for i in range(count):
+            # Frames between thumbnails are decoded without the colour conversion
+            while idx < i * step:
+                if not cap.grab():
+                    return
+                idx += 1
+            ok, frame = cap.read()
+            if not ok:
+                return
+            idx += 1
+            small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            thumbs[i] = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+            progress.value = i + 1
+        thumbs.flush()
+    finally:
+        cap.release()
+
+
+class ThumbnailStrip:
+    """Small RGB thumbnails of a whole video, cached next to it as a memmapped .npy.
+
+    The strip is built once by a background process while the tagger is in use;
+    thumbnails become available in order as they are written. A JSON sidecar
+    keyed by the video's size and mtime marks a finished strip, so later
+    sessions open it instantly.
+    """
+
+    def __init__(self, video_path, total_frames, fps, width, height, thumb_height=THUMB_HEIGHT):
+        self.video_path = video_path
+        self.total_frames = total_frames
+        self.step = max(1, int(round(fps / THUMBS_PER_SECOND)))
+        self.count = (total_frames + self.step - 1) // self.step
+        self.thumb_height = thumb_height
+        self.thumb_width = max(1, int(round(width * thumb_height / max(1, height))))
+        self.path = video_path + ".thumbs.npy"
+        self.meta_path = video_path + ".thumbs.json"
+        self.thumbs = None
+        self._done = 0
+        self._process = None
+        self._progress = None
+
+    def _meta(self):
+        st = os.stat(self.video_path)
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "step": self.step,
+                "shape": [self.count, self.thumb_height, self.thumb_width, 3]}
+
+    def start(self):
+        import numpy as np
+        meta = self._meta()
+        try:
+            with open(self.meta_path) as f:
+                saved = json.load(f)
+            if {k: saved.get(k) for k in meta} == meta:
+                self.thumbs = np.load(self.path, mmap_mode="r")
+                self._done = saved["done"]
+                return
+        except (OSError, ValueError, KeyError):
+            pass
+        try:
+            np.lib.format.open_memmap(self.path, mode="w+", dtype=np.uint8, shape=tuple(meta["shape"])).flush()
+        except OSError as e:
+            print(f"Thumbnail timeline disabled, cannot write {self.path}: {e}")
+            return
+        self.thumbs = np.load(self.path, mmap_mode="r")
+        # spawn rather than fork, the parent holds a Tk connection
+        ctx = multiprocessing.get_context("spawn")
+        self._progress = ctx.Value("i", 0, lock=False)
+        self._process = ctx.Process(target=build_thumbnails, daemon=True,
+                                    args=(self.video_path, self.path, self.step, self._progress))
+        self._process.start()
+
+    @property
+    def building(self):
+        return self._process is not None
+
+    def available(self):
+        # Number of thumbnails that can be read
+        if self.thumbs is None:
+            return 0
+        if self._process is not None:
+            self._done = self._progress.value
+            # Frame counts are estimates, so the build may finish short of self.count
+            if not self._process.is_alive():
+                self._process.join()
+                failed = self._process.exitcode != 0
+                self._process = None
+                if failed:
+                    print(f"Thumbnail build stopped after {self._done} of {self.count} thumbnails")
+                    return self._done
+                try:
+                    with open(self.meta_path, "w") as f:
+                        json.dump(dict(self._meta(), done=self._done), f)
+                except OSError:
+                    pass
+        return self._done
+
+    def index_for(self, frame_idx):
+        return min(self.count - 1, max(0, frame_idx // self.step))
+
+    def get(self, frame_idx):
+        i = self.index_for(frame_idx)
+        if i >= self.available():
+            return None
+        return self.thumbs[i]
+
+    def close(self):
+        # An unfinished strip has no sidecar and is rebuilt next time
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
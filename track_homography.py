@@ -0,0 +1,153 @@
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import cv2
+from apply_homography import Homography
+from coord_io import load_table, table_format
+from frame_source import KeyframeIndex, chunk_ranges, read_frames
+
+# Frames per worker task; each task re-decodes one frame of overlap
+CHUNK_FRAMES = 250
+# Frames wider than this are downscaled to it for matching; matching much
+# smaller frames costs accuracy, which accumulates along the chain
+MATCH_WIDTH = 960
+MAX_FEATURES = 2000
+# Pairs with fewer RANSAC inliers are treated as unmatched (camera assumed still)
+MIN_INLIERS = 15
+RANSAC_THRESHOLD = 3.0
+
+
+def estimate_chunk(video_path, start, stop, keyframe, scale=1.0, max_features=MAX_FEATURES):
+    """Relative homographies G for frames start..stop-1.
+
+    G[f] maps pixels of frame f to pixels of frame f - 1 (identity for frame 0
+    and for pairs that could not be matched). Returns (start, G, unmatched frames).
+    """
+    relative = np.tile(np.eye(3), (stop - start, 1, 1))
+    unmatched = []
+    orb = cv2.ORB_create(max_features)
+    matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+    # Conjugates a homography found on the downscaled frames back to full resolution
+    S = np.diag([scale, scale, 1.0])
+    S_inv = np.diag([1 / scale, 1 / scale, 1.0])
+    prev = None
+    for idx, frame in read_frames(video_path, max(0, start - 1), stop, keyframe):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if scale != 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        keypoints, descriptors = orb.detectAndCompute(gray, None)
+        if idx >= start and idx > 0:
+            H = None
+            if prev is not None and prev[1] is not None and descriptors is not None:
+                matches = matcher.match(descriptors, prev[1])
+                if len(matches) >= MIN_INLIERS:
+                    src = np.float32([keypoints[m.queryIdx].pt for m in matches])
+                    dst = np.float32([prev[0][m.trainIdx].pt for m in matches])
+                    H, inliers = cv2.findHomography(src, dst, cv2.RANSAC, RANSAC_THRESHOLD)
+                    if H is not None and inliers.sum() < MIN_INLIERS:
+                        H = None
+            if H is None:
+                unmatched.append(idx)
+            else:
+                relative[idx - start] = S_inv @ H @ S
+        prev = (keypoints, descriptors)
+    return start, relative, unmatched
+
+
+def chain_homographies(relative, reference):
+    # Composes relative homographies into per-frame maps from each frame's pixels
+    # to the reference frame's pixels
+    maps = np.empty_like(relative)
+    maps[reference] = np.eye(3)
+    for f in range(reference + 1, len(relative)):
+        maps[f] = maps[f - 1] @ relative[f]
+    for f in range(reference - 1, -1, -1):
+        maps[f] = maps[f + 1] @ np.linalg.inv(relative[f + 1])
+    return maps
+
+
+def reference_frame(court_csv):
+    # The frame the court points were clicked on, from the calibration's Frame column
+    if table_format(court_csv) == "csv":
+        court_df = pd.read_csv(court_csv)
+    else:
+        court_df = load_table(court_csv)
+    if "Frame" not in court_df.columns:
+        return None
+    frames = pd.to_numeric(court_df["Frame"], errors="coerce").dropna().astype(int)
+    if frames.empty:
+        return None
+    counts = Counter(frames)
+    if len(counts) > 1:
+        print(f"Warning: court points were tagged on frames {sorted(counts)}, using the most common one")
+    return counts.most_common(1)[0][0]
+
+
+def track_homography(video_path, court_csv, output_path=None, reference=None, workers=None,
+                     chunk_frames=CHUNK_FRAMES, match_width=MATCH_WIDTH):
+    if output_path is None:
+        output_path = os.path.splitext(video_path)[0] + "_homographies.npy"
+    calibration = Homography.from_calibration(court_csv)
+    if reference is None:
+        reference = reference_frame(court_csv) or 0
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Cannot open video '{video_path}'")
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    cap.release()
+    scale = min(1.0, match_width / width) if width else 1.0
+    if not 0 <= reference < total_frames:
+        raise ValueError(f"Reference frame {reference} is outside the video (0..{total_frames - 1})")
+
+    # Build the keyframe index once here rather than racing on it in every worker
+    keyframes = KeyframeIndex.load_or_build(video_path)
+    start_time = time.perf_counter()
+    relative = np.tile(np.eye(3), (total_frames, 1, 1))
+    unmatched = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(estimate_chunk, video_path, start, stop,
+                               keyframes.preceding(max(0, start - 1)) if keyframes else max(0, start - 1),
+                               scale)
+                   for start, stop in chunk_ranges(total_frames, chunk_frames)]
+        for future in futures:
+            start, chunk, missed = future.result()
+            relative[start:start + len(chunk)] = chunk
+            unmatched.extend(missed)
+
+    matrices = calibration.matrix @ chain_homographies(relative, reference)
+    matrices /= matrices[:, 2:3, 2:3]
+    np.save(output_path, matrices)
+    elapsed = time.perf_counter() - start_time
+    print(f"Tracked {total_frames} frames in {elapsed:.2f}s ({total_frames / elapsed:.0f} frames/s), "
+          f"reference frame {reference}, {len(unmatched)} unmatched")
+    print(f"Saved per-frame homographies to {output_path}")
+    return output_path, unmatched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate a pixel-to-metric homography for every frame "
+                                                 "of a panning or zooming clip")
+    parser.add_argument("video_path", type=str, help="Path to video file")
+    parser.add_argument("court_csv", type=str, help="Calibration from court_tagger.py (.csv, .npz or .parquet)")
+    parser.add_argument("--output", type=str, help="Output .npy (default: {video}_homographies.npy)")
+    parser.add_argument("--reference_frame", type=int, default=None,
+                        help="Frame the court points were tagged on (default: the calibration's Frame column, else 0)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--chunk_frames", type=int, default=CHUNK_FRAMES, help="Frames per worker task")
+    parser.add_argument("--match_width", type=int, default=MATCH_WIDTH,
+                        help="Frames wider than this are downscaled to it for feature matching")
+    args = parser.parse_args()
+    try:
+        track_homography(args.video_path, args.court_csv, args.output, args.reference_frame,
+                         args.workers, args.chunk_frames, args.match_width)
+    except (RuntimeError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
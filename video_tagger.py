@@ -1,50 +1,167 @@
+import time
+# Time-to-interactive is measured from here, so it includes the imports below
+_STARTED = time.perf_counter()
 import tkinter as tk
 from tkinter import ttk
-import cv2
 import csv
 import os
 from PIL import Image, ImageTk
 import argparse
 import sys
+import threading
+from frame_source import DEFAULT_CACHE_MB
+from proxy import PROXY_KINDS, open_frame_source
+from playback import Player, PLAYBACK_SPEEDS
+from rendering import DisplayCache, OverlayLayer, Filmstrip, Viewport, bind_viewport, disable_controls, enable_controls
+from thumbnails import ThumbnailStrip, THUMB_HEIGHT
+from annotation_store import AnnotationStore, MANUAL, PROPAGATED
+from propagation import Propagator, DEFAULT_PROPAGATE_FRAMES
+from interpolate import adaptive_step, MAX_MOTION_PX
+from journal import Journal, journal_path, replay
+from coord_io import FORMATS, save_table, table_format
+from perf import Profiler, PerfHud
 
 # Define paths here
 VIDEO_PATH = "example/tennis_test.mp4"
 LABELS_CSV = "example/labels.csv"
 # By default, output csv is saved to the same path as the video + "_tagged.csv"
 OUTPUT_CSV = None
+# Marker colour per point state: tagged by hand, or propagated by optical flow
+STATE_FILLS = {MANUAL: "#00ff00", PROPAGATED: "#ffa500"}
+STATE_NAMES = {MANUAL: "manual", PROPAGATED: "propagated"}
+# The full frame is decoded once the slider has been still for this long
+SETTLE_MS = 150
 
 class VideoTagger:
-    def __init__(self, root, video_path, label_list, output_csv):
+    def __init__(self, root, video_path, label_list, output_csv, cache_mb=DEFAULT_CACHE_MB,
+                 profiler=None, trace_path=None, proxy=None, sample_every=1, adaptive=False,
+                 max_motion=MAX_MOTION_PX):
         self.root = root
+        # Sparse tagging: completed frames advance by sample_every frames, or with
+        # adaptive by up to sample_every depending on how fast the points move
+        self.sample_every = max(1, sample_every)
+        self.adaptive = adaptive
+        self.max_motion = max_motion
+        self.profiler = profiler or Profiler()
+        self.trace_path = trace_path
         self.video_path = video_path
         self.labels = label_list
         self.output_csv = output_csv
         self.current_frame_idx = 0
-        self.clicked_points = []
         self.is_playing = False
-        self.slider_programmatic = False
+        self.player = None
+        self._slider_value = 0
 
 
         self.selected_label = tk.StringVar(value=self.labels[0])
-
-        self.cap = cv2.VideoCapture(self.video_path)
-        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
-        self.duration = self.total_frames / self.fps
-
+        self._settle_job = None
+        self._save_thread = None
+        self._propagation_job = None
+
+        # The window comes up with its controls disabled while a loader thread opens
+        # the video and decodes the first frame, which can take seconds on network
+        # drives or while the keyframe index is built on first use
+        self.source = None
+        self.total_frames = 0
         self.setup_gui()
         self._canvas_img_id = None  # Used to store the image ID on the canvas
         self.root.update_idletasks()
         self.display_width = self.canvas.winfo_width()
         self.display_height = self.canvas.winfo_height()
+        self.viewport = Viewport((self.display_width, self.display_height))
+        self.display_cache = DisplayCache((self.display_width, self.display_height), profiler=self.profiler,
+                                          viewport=self.viewport)
+        self.overlay = OverlayLayer(self.canvas, self.to_canvas)
+        self.hud = PerfHud(self.root, self.canvas, self.profiler)
+        # F2 toggles the timing overlay
+        self.root.bind("<F2>", lambda event: self.hud.toggle())
+        self._disabled = disable_controls(self.root)
+        self._loading_text = self.canvas.create_text(
+            self.display_width / 2, self.display_height / 2,
+            text=f"Opening {os.path.basename(self.video_path)}...")
+        self._opened = None
+        self._shown_at = None
+        self.root.protocol("WM_DELETE_WINDOW", self.cancel_open)
+        self._loader = threading.Thread(target=self.open_video, args=(cache_mb, proxy), daemon=True)
+        self._loader.start()
+        self.root.after(10, self.poll_open)
+
+    def open_video(self, cache_mb, proxy):
+        # Loader thread: everything that touches the video file, which is also
+        # where cv2 and numpy first get imported
+        start = time.perf_counter()
+        try:
+            source = open_frame_source(self.video_path, cache_mb, proxy)
+            source.get_frame(0)
+        except Exception as e:
+            self._opened = e
+            return
+        self._opened = (source, time.perf_counter() - start)
+
+    def cancel_open(self):
+        # Closed before the video was ready: with the window gone, wait for the
+        # loader so the video is closed before the interpreter exits
+        self.root.destroy()
+        self._loader.join()
+        if isinstance(self._opened, tuple):
+            self._opened[0].close()
+
+    def poll_open(self):
+        if self._shown_at is None:
+            self._shown_at = time.perf_counter()
+        if self._loader.is_alive():
+            self.root.after(10, self.poll_open)
+            return
+        if isinstance(self._opened, Exception):
+            print(f"Error: {self._opened}")
+            self.canvas.itemconfig(self._loading_text, text=f"Cannot open the video:\n{self._opened}")
+            return
+        source, open_s = self._opened
+        self.on_video_opened(source)
+        print(f"Window shown after {1000 * (self._shown_at - _STARTED):.0f} ms, interactive after "
+              f"{1000 * (time.perf_counter() - _STARTED):.0f} ms (opening the video and decoding "
+              f"the first frame took {1000 * open_s:.0f} ms)")
+
+    def on_video_opened(self, source):
+        self.source = source
+        self.total_frames = self.source.total_frames
+        self.fps = self.source.fps
+        self.duration = self.total_frames / self.fps
+        self.store = AnnotationStore(self.labels, self.total_frames)
+        self.thumbnails = ThumbnailStrip(self.video_path, self.total_frames, self.fps,
+                                         self.source.width, self.source.height)
+        self.resume_journal()
+        self.journal = Journal(journal_path(self.output_csv))
+        self.propagator = Propagator(self.source)
+        self.viewport.set_source(self.source.width, self.source.height)
+
+        self.filmstrip = Filmstrip(self.filmstrip_canvas, self.thumbnails)
+        self.canvas.delete(self._loading_text)
+        enable_controls(self._disabled)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.slider.config(to=max(0, self.total_frames - 1))
+        self.thumbnails.start()
+        self.poll_thumbnails()
         self.load_frame(self.current_frame_idx)
+        self.bind_events()
+
+    def bind_events(self):
+        # Bound once the video is open, the handlers all need it
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.slider.bind("<ButtonRelease-1>", lambda event: self.settle())
+        self.filmstrip_canvas.bind("<Button-1>", self.on_filmstrip_drag)
+        self.filmstrip_canvas.bind("<B1-Motion>", self.on_filmstrip_drag)
+        self.filmstrip_canvas.bind("<ButtonRelease-1>", lambda event: self.settle())
+        self.table.bind("<Button-1>", self.on_table_click)
         self.root.bind("<Left>", lambda event: self.prev_frame())
         self.root.bind("<Right>", lambda event: self.next_frame())
+        self.root.bind("<Shift-Left>", lambda event: self.go_to_frame(self.previous_sample(self.current_frame_idx)))
+        self.root.bind("<Shift-Right>", lambda event: self.go_to_frame(self.following_sample(self.current_frame_idx)))
+        bind_viewport(self.canvas, self.viewport, self.on_viewport_change)
 
     def setup_gui(self):
         self.canvas = tk.Canvas(self.root, width=800, height=450)
         self.canvas.pack()
-        self.canvas.bind("<Button-1>", self.on_click)
 
         ctrl_frame = tk.Frame(self.root)
         ctrl_frame.pack()
@@ -63,23 +180,46 @@ class VideoTagger:
         self.frame_label = tk.Label(ctrl_frame, text="Frame: 0")
         self.frame_label.grid(row=0, column=7, padx=10)
 
+        tk.Label(ctrl_frame, text="Speed:").grid(row=0, column=8)
+        self.playback_speed = tk.StringVar(value="1x")
+        speed_menu = ttk.Combobox(ctrl_frame, textvariable=self.playback_speed, state="readonly",
+                                  values=[f"{s:g}x" for s in PLAYBACK_SPEEDS], width=5)
+        speed_menu.grid(row=0, column=9)
+        speed_menu.bind("<<ComboboxSelected>>", self.on_speed_change)
+
+        self.playback_label = tk.Label(ctrl_frame, text="", width=22, anchor="w")
+        self.playback_label.grid(row=0, column=10, padx=10)
+
+        # Track each click's points forward so later frames only need corrections
+        self.propagate_enabled = tk.BooleanVar(value=False)
+        tk.Checkbutton(ctrl_frame, text="Propagate", variable=self.propagate_enabled).grid(row=1, column=0, columnspan=2)
+        tk.Label(ctrl_frame, text="Frames ahead:").grid(row=1, column=2)
+        self.propagate_frames = tk.IntVar(value=DEFAULT_PROPAGATE_FRAMES)
+        tk.Spinbox(ctrl_frame, from_=1, to=1000, textvariable=self.propagate_frames, width=5).grid(row=1, column=3)
+        self.propagate_label = tk.Label(ctrl_frame, text="", width=22, anchor="w")
+        self.propagate_label.grid(row=1, column=4, columnspan=3, padx=10)
+
         slider_frame = tk.Frame(self.root)
         slider_frame.pack(fill=tk.X, padx=10, pady=5)
 
         self.slider_time_label = tk.Label(slider_frame, text="00:00:00")
         self.slider_time_label.pack(side=tk.LEFT, padx=5)
 
-        self.slider = tk.Scale(slider_frame, from_=0, to=int(self.duration), orient=tk.HORIZONTAL,
+        # One slider step per frame
+        self.slider = tk.Scale(slider_frame, from_=0, to=max(0, self.total_frames - 1), orient=tk.HORIZONTAL,
                             showvalue=0, command=self.on_slider_move, length=700)
         self.slider.pack(side=tk.LEFT, fill=tk.X, expand=True)
 
         self.slider.pack(fill=tk.X, padx=10, pady=5)
 
+        self.filmstrip_canvas = tk.Canvas(self.root, height=THUMB_HEIGHT, bg="black", highlightthickness=0)
+        self.filmstrip_canvas.pack(fill=tk.X, padx=10)
+
         table_frame = tk.Frame(self.root)
         table_frame.pack(fill=tk.BOTH, expand=True)
 
-        self.table = ttk.Treeview(table_frame, columns=("Frame", "Label", "X", "Y", "Delete"), show="headings", height=6)
-        for col in ("Frame", "Label", "X", "Y", "Delete"):
+        self.table = ttk.Treeview(table_frame, columns=("Frame", "Label", "X", "Y", "Source", "Delete"), show="headings", height=6)
+        for col in ("Frame", "Label", "X", "Y", "Source", "Delete"):
             self.table.heading(col, text=col)
             self.table.column(col, width=100, anchor=tk.CENTER)
 
@@ -89,8 +229,6 @@ class VideoTagger:
         self.table.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         vsb.pack(side=tk.RIGHT, fill=tk.Y)
 
-        self.table.bind("<Button-1>", self.on_table_click)
-
         save_btn = tk.Button(self.root, text="Save & Exit", command=self.on_exit)
         save_btn.pack(pady=5)
 
@@ -101,105 +239,231 @@ class VideoTagger:
         return f"{h:02}:{m:02}:{s:02}"
 
     def load_frame(self, frame_idx):
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-        ret, frame = self.cap.read()
-        if not ret:
-            print(f"Failed to load frame {frame_idx}")
-            return
-        self.frame_bgr = frame.copy()
-        self.frame_label.config(text=f"Frame: {frame_idx}")
-        self.display_frame()
-        self.update_table()
-
-    def display_frame(self):
-        display = self.frame_bgr.copy()
-        self.original_width = display.shape[1]
-        self.original_height = display.shape[0]
-
-        for fr, lbl, x, y in self.clicked_points:
-            if fr == self.current_frame_idx:
-                cv2.circle(display, (x, y), 4, (0, 255, 0), -1)
-                cv2.putText(display, f"{lbl} - ({x}, {y})", (x + 5, y - 5),
-                            cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-
-        display_rgb = cv2.cvtColor(display, cv2.COLOR_BGR2RGB)
-        resized_img = Image.fromarray(display_rgb).resize((self.display_width, self.display_height))
-        self.tk_img = ImageTk.PhotoImage(resized_img)
-
+        with self.profiler.stage("frame"):
+            with self.profiler.stage("decode"):
+                frame = self.source.get_frame(frame_idx)
+            if frame is None:
+                print(f"Failed to load frame {frame_idx}")
+                return
+            # Cached frames are shared and must not be drawn on
+            self.frame_bgr, self.frame_bgr_idx = frame, frame_idx
+            self.frame_label.config(text=f"Frame: {frame_idx}")
+            self.show_image(self.display_cache.get(frame_idx, frame))
+            self.display_frame()
+            self.update_table()
+
+    def show_image(self, rgb):
+        with self.profiler.stage("photoimage"):
+            self.tk_img = ImageTk.PhotoImage(Image.fromarray(rgb))
         if self._canvas_img_id is None:
             self._canvas_img_id = self.canvas.create_image(0, 0, anchor="nw", image=self.tk_img)
+            self.canvas.tag_lower(self._canvas_img_id)
         else:
             self.canvas.itemconfig(self._canvas_img_id, image=self.tk_img)
 
+    def to_canvas(self, x, y):
+        # Points are kept in original-resolution pixels, also when frames come from a smaller proxy
+        return self.viewport.to_canvas(x, y)
+
+    def on_viewport_change(self):
+        # Zoom or pan: re-crop the current frame (playback crops its own) and move the markers
+        if not self.is_playing and self.frame_bgr_idx == self.current_frame_idx:
+            self.show_image(self.display_cache.get(self.frame_bgr_idx, self.frame_bgr))
+        self.overlay.relayout()
+
+    def display_frame(self):
+        # Sync the marker layer with the current frame's points; the image is left alone
+        with self.profiler.stage("overlay"):
+            self.overlay.sync({
+                lbl: (x, y, f"{lbl} - ({x}, {y})", STATE_FILLS[st])
+                for lbl, x, y, st in self.store.frame_entries(self.current_frame_idx)
+            })
+
 
     def on_click(self, event):
-        x_scale = self.frame_bgr.shape[1] / 800
-        y_scale = self.frame_bgr.shape[0] / 450
-        x = int(event.x * x_scale)
-        y = int(event.y * y_scale)
+        self.pause_video()
+        x, y = self.viewport.to_source(event.x, event.y)
         label = self.selected_label.get()
 
-        self.clicked_points = [
-            (fr, lbl, xp, yp) for fr, lbl, xp, yp in self.clicked_points
-            if not (fr == self.current_frame_idx and lbl == label)
-        ]
-
-        self.clicked_points.append((self.current_frame_idx, label, x, y))
+        with self.profiler.stage("click"):
+            self.store.upsert(self.current_frame_idx, label, x, y)
+            self.journal.append("set", self.current_frame_idx, label, x, y)
+            with self.profiler.stage("overlay"):
+                self.overlay.set(label, x, y, f"{label} - ({x}, {y})", STATE_FILLS[MANUAL])
+            with self.profiler.stage("table"):
+                self.update_table_row(label)
         print(f"Clicked: Frame {self.current_frame_idx}, {label}, ({x}, {y})")
+        if self.propagate_enabled.get():
+            self.propagate()
 
         current_idx = self.labels.index(label)
         next_idx = (current_idx + 1) % len(self.labels)
         self.selected_label.set(self.labels[next_idx])
         self.label_menu.set(self.labels[next_idx])
 
-        self.display_frame()
-        self.update_table()
-
         if self.labels_filled():
-            self.next_frame()
+            self.go_to_frame(self.next_sample())
 
     def labels_filled(self):
-        return set(lbl for fr, lbl, _, _ in self.clicked_points if fr == self.current_frame_idx) == set(self.labels)
+        # Propagated points still need a look, only a fully hand-tagged frame advances
+        return self.store.is_complete(self.current_frame_idx, MANUAL)
+
+    def previous_sample(self, frame):
+        # Last frame before `frame` with every label tagged by hand
+        import numpy as np
+        complete = self.store.complete_frames(MANUAL)
+        i = np.searchsorted(complete, frame) - 1
+        return int(complete[i]) if i >= 0 else 0
+
+    def following_sample(self, frame):
+        # First frame after `frame` with every label tagged by hand, or where the
+        # next sample is due once past the last one
+        import numpy as np
+        complete = self.store.complete_frames(MANUAL)
+        i = np.searchsorted(complete, frame, side="right")
+        return int(complete[i]) if i < len(complete) else self.next_sample()
+
+    def next_sample(self):
+        step = self.sample_every
+        if self.adaptive:
+            prev = self.previous_sample(self.current_frame_idx)
+            if prev < self.current_frame_idx:
+                step = adaptive_step({lbl: (x, y) for lbl, x, y in self.store.frame_points(prev)},
+                                     {lbl: (x, y) for lbl, x, y in self.store.frame_points(self.current_frame_idx)},
+                                     self.current_frame_idx - prev, self.sample_every, self.max_motion)
+        return min(self.total_frames - 1, self.current_frame_idx + step)
+
+    def propagate(self):
+        start = self.current_frame_idx
+        points = {lbl: (x, y) for lbl, x, y in self.store.frame_points(start)}
+        if not points:
+            return
+        try:
+            num_frames = max(1, int(self.propagate_frames.get()))
+        except (tk.TclError, ValueError):
+            num_frames = DEFAULT_PROPAGATE_FRAMES
+        # Hand-tagged points ahead are kept and re-seed the tracker
+        anchors = {(fr, lbl): (x, y)
+                   for fr in range(start + 1, start + num_frames + 1)
+                   for lbl, x, y, st in self.store.frame_entries(fr) if st == MANUAL}
+        self.propagator.submit(start, points, num_frames, anchors)
+        self.propagate_label.config(text=f"Tracking {num_frames} frames...")
+        if self._propagation_job is None:
+            self._propagation_job = self.root.after(30, self.poll_propagation)
+
+    def poll_propagation(self):
+        self._propagation_job = None
+        for fr, points in self.propagator.poll():
+            for lbl, point in points.items():
+                if self.store.state(fr, lbl) == MANUAL:
+                    continue
+                if point is None:
+                    # Lost track: drop whatever an earlier run propagated here
+                    if self.store.delete(fr, lbl):
+                        self.journal.append("delete", fr, lbl)
+                else:
+                    self.store.upsert(fr, lbl, point[0], point[1], state=PROPAGATED)
+                    self.journal.append("set", fr, lbl, point[0], point[1], PROPAGATED)
+            if fr == self.current_frame_idx and not self.is_playing:
+                self.display_frame()
+                self.update_table()
+        if self.propagator.busy or not self.propagator.results.empty():
+            self._propagation_job = self.root.after(30, self.poll_propagation)
+        else:
+            self.propagate_label.config(text="")
 
-    def prev_frame(self):
-        self.current_frame_idx = max(0, self.current_frame_idx - 1)
-        self.slider_programmatic = True
-        time_sec = self.current_frame_idx / self.fps
-        self.slider.set(time_sec)
-        self.slider_time_label.config(text=self.seconds_to_hms(time_sec))
-        self.slider_programmatic = False
+    def sync_slider(self, frame_idx):
+        self._slider_value = frame_idx
+        self.slider.set(frame_idx)
+        self.slider_time_label.config(text=self.seconds_to_hms(frame_idx / self.fps))
+        self.filmstrip.show(frame_idx)
+
+    def go_to_frame(self, frame_idx):
+        self.current_frame_idx = min(self.total_frames - 1, max(0, frame_idx))
+        self.sync_slider(self.current_frame_idx)
         self.load_frame(self.current_frame_idx)
 
+    def prev_frame(self):
+        self.go_to_frame(self.current_frame_idx - 1)
+
     def next_frame(self):
-        self.current_frame_idx = min(self.total_frames - 1, self.current_frame_idx + 1)
-        self.slider_programmatic = True
-        time_sec = self.current_frame_idx / self.fps
-        self.slider.set(time_sec)
-        self.slider_time_label.config(text=self.seconds_to_hms(time_sec))
-        self.slider_programmatic = False
-        self.load_frame(self.current_frame_idx)
+        self.go_to_frame(self.current_frame_idx + 1)
 
     def on_slider_move(self, val):
-        if self.slider_programmatic:
+        # Tk runs this at idle, also for slider.set() in sync_slider, so a value we
+        # already handled is not a user move and must not pause playback
+        frame_idx = int(float(val))
+        if frame_idx == self._slider_value:
             return
-        seconds = float(val)
-        self.slider_time_label.config(text=self.seconds_to_hms(seconds))
-        self.current_frame_idx = int(seconds * self.fps)
+        self._slider_value = frame_idx
+        self.pause_video()
+        self.current_frame_idx = frame_idx
+        self.slider_time_label.config(text=self.seconds_to_hms(self.current_frame_idx / self.fps))
+        self.filmstrip.show(self.current_frame_idx)
+        if self.source.is_cached(self.current_frame_idx):
+            self.settle()
+            return
+        # While dragging show the nearest thumbnail and decode once the slider settles
+        preview = self.filmstrip.preview(self.current_frame_idx, (self.display_width, self.display_height),
+                                         self.viewport)
+        if preview is not None:
+            self.show_image(preview)
+            self.frame_label.config(text=f"Frame: {self.current_frame_idx} (preview)")
+            self.display_frame()
+        if self._settle_job is not None:
+            self.root.after_cancel(self._settle_job)
+        self._settle_job = self.root.after(SETTLE_MS, self.settle)
+
+    def settle(self):
+        if self._settle_job is not None:
+            self.root.after_cancel(self._settle_job)
+            self._settle_job = None
         self.load_frame(self.current_frame_idx)
 
+    def on_filmstrip_drag(self, event):
+        # Moving the slider runs on_slider_move, which previews and schedules the decode
+        self.slider.set(self.filmstrip.frame_at(event.x))
+
+    def poll_thumbnails(self):
+        # Redraw the filmstrip as thumbnails arrive until the background build is done
+        self.filmstrip.show(self.current_frame_idx)
+        if self.thumbnails.building:
+            self.root.after(500, self.poll_thumbnails)
+
 
     def reset_clicks(self):
-        self.clicked_points = [pt for pt in self.clicked_points if pt[0] != self.current_frame_idx]
+        self.journal.append("clear", self.current_frame_idx)
+        for lbl in self.store.clear_frame(self.current_frame_idx):
+            self.table.delete(lbl)
         self.label_menu.set(self.labels[0])
-        self.display_frame()
-        self.update_table()
+        self.overlay.clear()
 
     def update_table(self):
-        for row in self.table.get_children():
-            self.table.delete(row)
-        for fr, lbl, x, y in self.clicked_points:
-            if fr == self.current_frame_idx:
-                self.table.insert("", "end", values=(fr, lbl, x, y, "Delete"))
+        # Rows are keyed by label and only the differences to the current frame are applied
+        with self.profiler.stage("table"):
+            points = {lbl: (x, y) for lbl, x, y in self.store.frame_points(self.current_frame_idx)}
+            for lbl in self.table.get_children():
+                if lbl not in points:
+                    self.table.delete(lbl)
+            for lbl in points:
+                self.update_table_row(lbl)
+
+    def update_table_row(self, label):
+        point = self.store.get(self.current_frame_idx, label)
+        if point is None:
+            if self.table.exists(label):
+                self.table.delete(label)
+            return
+        source = STATE_NAMES[self.store.state(self.current_frame_idx, label)]
+        values = (self.current_frame_idx, label, point[0], point[1], source, "Delete")
+        if self.table.exists(label):
+            if tuple(self.table.item(label, "values")) != tuple(str(v) for v in values):
+                self.table.item(label, values=values)
+            return
+        # Keep rows in label order
+        position = sum(1 for lbl in self.table.get_children()
+                       if self.labels.index(lbl) < self.labels.index(label))
+        self.table.insert("", position, iid=label, values=values)
 
     def on_table_click(self, event):
         region = self.table.identify("region", event.x, event.y)
@@ -207,75 +471,197 @@ class VideoTagger:
             return
         col = self.table.identify_column(event.x)
         row = self.table.identify_row(event.y)
-        if not row or col != "#5":
+        if not row or col != "#6":
             return
         values = self.table.item(row)["values"]
-        if len(values) != 5:
+        if len(values) != 6:
             return
         try:
-            fr, lbl, x, y, _ = values
-            fr = int(fr)
-            x = int(x)
-            y = int(y)
+            fr = int(values[0])
         except ValueError:
             return
-        self.clicked_points = [
-            pt for pt in self.clicked_points
-            if not (pt[0] == fr and pt[1] == lbl and pt[2] == x and pt[3] == y)
-        ]
-        self.display_frame()
-        self.update_table()
+        self.store.delete(fr, row)
+        self.journal.append("delete", fr, row)
+        if fr == self.current_frame_idx:
+            self.overlay.remove(row)
+        self.table.delete(row)
 
     def play_video(self):
-        if not self.is_playing:
-            self.is_playing = True
-            self.auto_play()
+        if self.is_playing or self.current_frame_idx >= self.total_frames - 1:
+            return
+        self.is_playing = True
+        self.player = Player(self.video_path, self.fps, self.total_frames, self.current_frame_idx + 1,
+                             (self.display_width, self.display_height), speed=self.get_speed(),
+                             prepare=lambda idx, frame: self.viewport.render(frame))
+        self._play_img = ImageTk.PhotoImage("RGB", (self.display_width, self.display_height))
+        self.player.start()
+        self.auto_play()
 
     def pause_video(self):
+        if not self.is_playing:
+            return
         self.is_playing = False
+        self.player.stop()
+        print(f"Playback: {self.player.presented} frames shown, {self.player.dropped} dropped, "
+              f"{self.player.skipped} skipped at {self.player.target_fps:.1f} fps target")
+        self.player = None
+        self.playback_label.config(text="")
+        self.load_frame(self.current_frame_idx)
+
+    def get_speed(self):
+        return float(self.playback_speed.get().rstrip("x"))
+
+    def on_speed_change(self, event=None):
+        if self.is_playing:
+            self.player.set_speed(self.get_speed(), self.current_frame_idx)
 
     def auto_play(self):
-        if self.is_playing and self.current_frame_idx < self.total_frames - 1:
-            self.next_frame()
-            self.root.after(int(1000 / self.fps), self.auto_play)
+        if not self.is_playing:
+            return
+        item = self.player.poll()
+        if item is not None:
+            frame_idx, rgb = item
+            self.current_frame_idx = frame_idx
+            self.frame_label.config(text=f"Frame: {frame_idx}")
+            self.sync_slider(frame_idx)
+            with self.profiler.stage("present"):
+                self._play_img.paste(Image.fromarray(rgb))
+                self.canvas.itemconfig(self._canvas_img_id, image=self._play_img)
+            self.display_frame()
+            self.playback_label.config(
+                text=f"{self.player.achieved_fps():.1f} / {self.player.target_fps:.1f} fps")
+        if self.player.finished:
+            self.pause_video()
+            return
+        self.root.after(self.player.delay_ms(), self.auto_play)
+
+    def resume_journal(self):
+        # A journal left next to the output means the last session did not exit cleanly
+        applied = 0
+        for record in replay(journal_path(self.output_csv)):
+            op, fr = record[0], record[1]
+            if op == "set" and record[2] in self.labels:
+                state = record[5] if len(record) > 5 else MANUAL
+                self.store.upsert(fr, record[2], record[3], record[4], state=state)
+            elif op == "delete" and record[2] in self.labels:
+                self.store.delete(fr, record[2])
+            elif op == "clear":
+                self.store.clear_frame(fr)
+            applied += 1
+        if applied:
+            print(f"Resumed {applied} changes ({len(self.store)} points) from {journal_path(self.output_csv)}")
+
+    def on_close(self):
+        # Closed without saving: the journal is flushed and kept, so the next
+        # session resumes from it
+        self.pause_video()
+        self.propagator.cancel()
+        self.journal.close()
+        self.root.destroy()
 
     def on_exit(self):
-        # ensure directory exists
-        os.makedirs(os.path.dirname(self.output_csv) or ".", exist_ok=True)
-
-        # prepare data: frame → label → (x, y)
-        frame_dict = {}
-        for fr, lbl, x, y in self.clicked_points:
-            if fr not in frame_dict:
-                frame_dict[fr] = {}
-            frame_dict[fr][lbl] = (x, y)
-
-        # build header: frame, left_ankle_x, left_ankle_y, right_wrist_x, right_wrist_y, etc.
-        header = ["frame"]
-        for lbl in self.labels:
-            header.append(f"{lbl}_x")
-            header.append(f"{lbl}_y")
-
-        with open(self.output_csv, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(header)
-
-            for fr in sorted(frame_dict.keys()):
-                row = [fr]
-                label_dict = frame_dict[fr]
-                for lbl in self.labels:
-                    if lbl in label_dict:
-                        x, y = label_dict[lbl]
-                        row.extend([x, y])
-                    else:
-                        row.extend(["", ""])  # empty if not annotated
-                writer.writerow(row)
-
-        print(f"Saved {len(frame_dict)} frames to {self.output_csv}")
+        self.pause_video()
+        self.propagator.cancel()
+        if self._save_thread is not None:
+            return
+        # Snapshot the store and write the CSV off the UI thread
+        frames, xy, state = self.store.to_arrays()
+        self._save_error = None
+
+        def compact():
+            try:
+                write_tagged(self.output_csv, self.labels, frames, xy, state)
+            except OSError as e:
+                self._save_error = e
+
+        self.frame_label.config(text="Saving...")
+        self._save_thread = threading.Thread(target=compact)
+        self._save_thread.start()
+        self.root.after(50, self.finish_exit, len(frames))
+
+    def finish_exit(self, num_frames):
+        if self._save_thread.is_alive():
+            self.root.after(50, self.finish_exit, num_frames)
+            return
+        if self._save_error is not None:
+            print(f"Failed to save {self.output_csv}: {self._save_error}")
+            self._save_thread = None
+            self.frame_label.config(text=f"Frame: {self.current_frame_idx}")
+            return
+        # The CSV now holds everything, the journal is no longer needed
+        self.journal.close(remove=True)
+        if self.trace_path:
+            self.profiler.dump_trace(self.trace_path)
+        print(f"Saved {num_frames} frames to {self.output_csv}")
+        self.thumbnails.close()
+        self.source.close()
         self.root.destroy()
         sys.exit(0)
 
 
+def has_flags(state):
+    # {label}_flag columns are only written once something other than a hand-tagged point exists
+    import numpy as np
+    return bool(np.any(state > MANUAL))
+
+def tagged_frame(labels, frames, xy, state):
+    # Same schema as the CSV: frame, then {label}_x, {label}_y with NaN where not annotated
+    import numpy as np
+    import pandas as pd
+    coords = xy.astype(np.float64)
+    coords[state == 0] = np.nan
+    columns = [f"{lbl}_{axis}" for lbl in labels for axis in ("x", "y")]
+    df = pd.DataFrame(coords.reshape(len(frames), 2 * len(labels)), columns=columns)
+    df.insert(0, "frame", np.asarray(frames, dtype=np.int64))
+    if has_flags(state):
+        flags = pd.DataFrame(state, columns=[f"{lbl}_flag" for lbl in labels])
+        df = pd.concat([df, flags], axis=1)
+    return df
+
+def write_tagged(output_path, labels, frames, xy, state):
+    if table_format(output_path) == "csv":
+        write_tagged_csv(output_path, labels, frames, xy, state)
+        return
+    # Write next to the target and rename, so a crash never leaves a truncated file
+    base, ext = os.path.splitext(output_path)
+    tmp_path = base + ".tmp" + ext
+    save_table(tagged_frame(labels, frames, xy, state), tmp_path)
+    os.replace(tmp_path, output_path)
+
+def write_tagged_csv(output_csv, labels, frames, xy, state):
+    # ensure directory exists
+    os.makedirs(os.path.dirname(output_csv) or ".", exist_ok=True)
+
+    # build header: frame, left_ankle_x, left_ankle_y, right_wrist_x, right_wrist_y, etc.
+    header = ["frame"]
+    for lbl in labels:
+        header.append(f"{lbl}_x")
+        header.append(f"{lbl}_y")
+    flags = has_flags(state)
+    if flags:
+        header.extend(f"{lbl}_flag" for lbl in labels)
+
+    # Write next to the target and rename, so a crash never leaves a truncated CSV
+    tmp_path = output_csv + ".tmp"
+    with open(tmp_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+
+        for fr, points, states in zip(frames.tolist(), xy.tolist(), state.tolist()):
+            row = [fr]
+            for (x, y), st in zip(points, states):
+                if st:
+                    row.extend([x, y])
+                else:
+                    row.extend(["", ""])  # empty if not annotated
+            if flags:
+                row.extend(states)
+            writer.writerow(row)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, output_csv)
+
+
 def load_labels(label_csv):
     labels = []
     with open(label_csv, newline="") as f:
@@ -284,7 +670,8 @@ def load_labels(label_csv):
             labels.append(row["label"])
     return labels
 
-def main(video_path=None, labels_csv=None, output_csv=None):
+def main(video_path=None, labels_csv=None, output_csv=None, cache_mb=DEFAULT_CACHE_MB, output_format="csv",
+         profile=False, trace_path=None, proxy=None, sample_every=1, adaptive=False, max_motion=MAX_MOTION_PX):
     if video_path is None or labels_csv is None:
         print("Please specify at least a video path and a labels CSV.")
         return
@@ -297,11 +684,16 @@ def main(video_path=None, labels_csv=None, output_csv=None):
     if output_csv is None:
         base = os.path.splitext(os.path.basename(video_path))[0]
         directory = os.path.dirname(video_path)
-        output_csv = os.path.join(directory, base + "_tagged.csv")
+        output_csv = os.path.join(directory, base + "_tagged." + output_format)
 
     root = tk.Tk()
     root.title("Video Point Tagger")
-    VideoTagger(root, video_path, labels, output_csv)
+    profiler = Profiler(enabled=profile, trace=bool(trace_path))
+    tagger = VideoTagger(root, video_path, labels, output_csv, cache_mb=cache_mb,
+                         profiler=profiler, trace_path=trace_path, proxy=proxy,
+                         sample_every=sample_every, adaptive=adaptive, max_motion=max_motion)
+    if profile:
+        tagger.hud.show()
     root.mainloop()
 
 if __name__ == "__main__":
@@ -309,9 +701,27 @@ if __name__ == "__main__":
         parser = argparse.ArgumentParser(description="GUI tool for tagging video points")
         parser.add_argument("video_path", type=str, help="Path to video file")
         parser.add_argument("labels_csv", type=str, help="CSV with label column")
-        parser.add_argument("--output_csv", type=str, help="Optional output CSV path")
+        parser.add_argument("--output_csv", type=str,
+                            help="Optional output path (.csv, .npz or .parquet)")
+        parser.add_argument("--output_format", choices=FORMATS, default="csv",
+                            help="Format of the default output file when --output_csv is not given")
+        parser.add_argument("--cache_mb", type=int, default=DEFAULT_CACHE_MB,
+                            help="Memory budget in MB for decoded frames")
+        parser.add_argument("--profile", action="store_true",
+                            help="Show the per-stage timing overlay (toggle with F2)")
+        parser.add_argument("--trace", type=str,
+                            help="Record every timed stage and save a Chrome trace JSON here on exit")
+        parser.add_argument("--proxy", choices=PROXY_KINDS,
+                            help="Serve frames from a raw memory-mapped proxy (built on first use, see proxy.py)")
+        parser.add_argument("--sample_every", type=int, default=1,
+                            help="Advance this many frames after each completed frame (fill the rest with interpolate.py)")
+        parser.add_argument("--adaptive", action="store_true",
+                            help="Choose the step from how fast points move, up to --sample_every frames")
+        parser.add_argument("--max_motion", type=float, default=MAX_MOTION_PX,
+                            help="Target movement in pixels between adaptive samples")
         args = parser.parse_args()
-        main(args.video_path, args.labels_csv, args.output_csv)
+        main(args.video_path, args.labels_csv, args.output_csv, args.cache_mb, args.output_format,
+             args.profile, args.trace, args.proxy, args.sample_every, args.adaptive, args.max_motion)
     else:
         # Define your paths here if you don't want to use command line
         main(VIDEO_PATH, LABELS_CSV, OUTPUT_CSV)
\ No newline at end of file